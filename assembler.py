@@ -2,88 +2,211 @@
 # Shebang to make running this easier
 # Only works for UNIX kernels with the functionality available
 # (for example, compiling the Linux kernel with the support enabled in the .config file)
-import sys, re, unicodedata, struct, argparse
-from typing import List, Tuple
+import sys, os, re, argparse, mmap
+from typing import List, Set, Tuple, Iterator
 
-from include import Token, Addr_Modes, TokenType, error, assembler_options
+from include import Token, TokenType, Addr_Modes, error, assembler_options, diagnostics
 from include import TUPLE_MNEMONIC, TUPLE_ADDR_MODE, TUPLE_ARG, TUPLE_ARGTYPE
-from include import TABLE_ADDR_MODE, TABLE_BYTECODE, TABLE_IS_DOCUMENTED
-from include import Addr_Modes_Strings, addressing_modes
-from tables import literal_position, size_in_bytes, arg_types, instruction_info
+from include import ENTRY_OPCODE, ENTRY_ARG_TYPE, ENTRY_UNDOCUMENTED
+from include import Addr_Modes_Strings, addressing_mode_index, index_registers, index_register_positions
+from tables import literal_position, arg_types, instruction_mnemonics, opcode_table, relative_branches, directive_operands
 
 from value_literal import evaluate_value_literal, strip_value_literal, convert_value_literal
 
-from regex import regex_init
-
-from help_defs import HelpMessage, print_instruction_help
-from help_instruction_table import instructions
+from regex import regex_init, regex_init_buffer, regex_init_bytes
+from line_cache import LineCache
+from symbols import SymbolTable, SymbolIndex, export_symbols
+from ir import Program, ENCODE_RELATIVE, ENCODING_SIZES, ARG_TYPE_ENCODINGS, NO_SYMBOL, NO_FILL
+from expressions import Expression, compile_expression, expression_token_types
+from emitter import build_image, image_bounds
+from segments import MemoryImage, MappedMemoryImage
+from formats import output_writers
+from patch import patch_writers
+from crunch import Cruncher, crunch_image
+from listing import Listing
+from backpatch import SinglePassEmitter
+from relax import relax_branches
+from optimize import zero_page_equivalents, zero_page_entry, ZeroPageStats
+from lexer import clean_line, tokenize, scan_line, tokenize_buffer, clean_line_bytes, tokenize_bytes
+from preprocess import preprocess, preprocess_bytes
 
 argc = len(sys.argv)
 
-def is_mnemonic(mnemonic: str, *matches: str) -> bool:
-    for match in matches:
-        if (mnemonic == match):
-            return True
-    return False
-
-def clean_line(line: str) -> str:
-    return ''.join(ch for ch in line if unicodedata.category(ch)[0] != "C" and ch != " ").upper()
-
-def tokenize(line: str, r: re) -> List[Token]:
-    tokens: List[Token] = []
-    # Scan the input line using the regexuwu
-    for match in r.finditer(line):
-        token_type = match.lastgroup
-        value = match.group(token_type)
-        tokens.append(Token(token_type, value))
-    tokens.append(Token(TokenType.EOF, "EOF"))
-    return tokens
-
-def compile_token_types(tokens: Token) -> List[TokenType]:
-    types: List[TokenType] = []
-    for token in tokens:
-        types.append(token.type)
-    return types
-
 # literal_position == list of positions of value literal for each addressing mode that will act as the instruction's arguments. 0 means the addressing mode doesn't have one
-def evaluate_line(tokens: List[Token], linenum: int) -> Tuple[str, Addr_Modes, str, int]:
-    for mode, pattern in addressing_modes.items():
-        if (compile_token_types(tokens) == pattern):
-            if (literal_position.get(mode, 0) != 0):
-                # (mnemonic, addressing mode, value literal if exists, argument size (8 or 16))
-                return (tokens[0].value, mode, tokens[literal_position.get(mode, 0)].value, arg_types[mode])
+def match_addressing_mode(tokens: List[Token]) -> Tuple[str, Addr_Modes, str, int]:
+    # One lookup in the dispatch index gives every addressing mode this token sequence can be
+    for mode in addressing_mode_index.get(tuple(token.type for token in tokens), ()):
+        # X and Y indexed modes share a pattern, so pick the one whose index register was actually written
+        register: str = index_registers.get(mode)
+        if (register != None and tokens[index_register_positions[mode]].value != register):
+            continue
+        if (literal_position.get(mode, 0) != 0):
+            # (mnemonic, addressing mode, value literal if exists, argument size (8 or 16))
+            return (tokens[0].value, mode, tokens[literal_position.get(mode, 0)].value, arg_types[mode])
+        else:
+            if (mode == Addr_Modes.ASSEMBLER_OPTION):
+                return ("", mode, tokens[len(tokens) - 2].value, arg_types[mode])
+            elif (mode == Addr_Modes.LABEL):
+                return ("", mode, tokens[0].value, arg_types[mode])
+            elif (mode == Addr_Modes.JUMP_LABEL):
+                return (tokens[0].value, mode, tokens[2].value, arg_types[mode])
+            else:
+                return (tokens[0].value, mode, "", arg_types[mode])
+    return None
+
+# Where the operand of an instruction is an expression (it uses a label or an operator), the range of its tokens. None for anything else,
+# including plain value literals and jumps to a plain label, which keep their own addressing mode patterns
+def operand_expression_span(tokens: List[Token]) -> Tuple[int, int]:
+    if (len(tokens) < 3 or tokens[0].type != TokenType.MNEMONIC):
+        return None
+    start: int = 2 if tokens[1].type in (TokenType.COMMA, TokenType.HASH, TokenType.OPENING_BRACKET) else 1
+    end: int = start
+    while (end < len(tokens) and tokens[end].type in expression_token_types):
+        end += 1
+    if (end == start):
+        return None
+    if (end - start == 1):
+        if (tokens[start].type in (TokenType.LITERAL_8BIT, TokenType.LITERAL_16BIT)):
+            return None
+        if (tokens[1].type == TokenType.COMMA and tokens[end].type == TokenType.EOF and (tokens[0].value, Addr_Modes.JUMP_LABEL) in opcode_table):
+            return None
+    return (start, end)
+
+def evaluate_line(tokens: List[Token], linenum: int, symbols: SymbolTable) -> Tuple[str, Addr_Modes, str, int]:
+    # Constant definitions: "NAME = expression". The name goes where the mnemonic would, the compiled expression where the value literal would
+    if (len(tokens) > 3 and tokens[0].type == TokenType.MNEMONIC and tokens[1].type == TokenType.EQUALS):
+        try:
+            return (tokens[0].value, Addr_Modes.CONSTANT, compile_expression(tokens[2:-1], symbols), arg_types[Addr_Modes.CONSTANT])
+        except ValueError as e:
+            diagnostics.line_error(linenum, str(e))
+            return None
+
+    # Directives: ".name operand, ...", every operand an expression. The separator in front of an operand starting with a label is skipped
+    if (tokens[0].type == TokenType.DIRECTIVE):
+        if (tokens[0].value not in directive_operands):
+            diagnostics.line_error(linenum, f"Unknown directive '{tokens[0].value}'")
+            return None
+        operand_tokens: List[Token] = tokens[2:-1] if len(tokens) > 2 and tokens[1].type == TokenType.COMMA else tokens[1:-1]
+        operands: List[List[Token]] = [[]]
+        for token in operand_tokens:
+            if (token.type == TokenType.COMMA):
+                operands.append([])
             else:
-                if (mode == Addr_Modes.ASSEMBLER_OPTION):
-                    return ("", mode, tokens[len(tokens) - 2].value, arg_types[mode])
-                elif (mode == Addr_Modes.LABEL):
-                    return ("", mode, tokens[0].value, arg_types[mode])
-                elif (mode == Addr_Modes.JUMP_LABEL):
-                    return (tokens[0].value, mode, tokens[2].value, arg_types[mode])
-                else:
-                    return (tokens[0].value, mode, "", arg_types[mode])
+                operands[-1].append(token)
+        fewest, most = directive_operands[tokens[0].value]
+        if (len(operand_tokens) == 0 or not fewest <= len(operands) <= most):
+            diagnostics.line_error(linenum, f"'{tokens[0].value}' takes {fewest if fewest == most else f'{fewest} to {most}'} {'operand' if most == 1 else 'operands'}")
+            return None
+        try:
+            return (tokens[0].value, Addr_Modes.DIRECTIVE, [compile_expression(operand, symbols) for operand in operands], arg_types[Addr_Modes.DIRECTIVE])
+        except ValueError as e:
+            diagnostics.line_error(linenum, str(e))
+            return None
+
+    span: Tuple[int, int] = operand_expression_span(tokens)
+    if (span == None):
+        line_representation: Tuple[str, Addr_Modes, str, int] = match_addressing_mode(tokens)
+    else:
+        try:
+            expression: Expression = compile_expression(tokens[span[0]:span[1]], symbols)
+        except ValueError as e:
+            diagnostics.line_error(linenum, str(e))
+            return None
+
+        # The expression stands in for a value literal, 16 bit unless its value is known to fit in 8 bits or only an 8 bit mode matches.
+        # Prefer whichever size the instruction actually supports. The separator in front of an operand starting with a label goes away here
+        prefix: List[Token] = tokens[:1] if tokens[1].type == TokenType.COMMA else tokens[:span[0]]
+        if (expression.constant != None and 0 <= expression.constant <= 0xFF):
+            literal_types: Tuple[int, int] = (TokenType.LITERAL_8BIT, TokenType.LITERAL_16BIT)
         else:
-            continue
-    error(f"[ERROR line: {linenum}]: Unknown addressing mode {' '.join(token.value for token in tokens)}", crash=True)
+            literal_types: Tuple[int, int] = (TokenType.LITERAL_16BIT, TokenType.LITERAL_8BIT)
+        line_representation: Tuple[str, Addr_Modes, str, int] = None
+        for literal_type in literal_types:
+            candidate: Tuple[str, Addr_Modes, str, int] = match_addressing_mode([*prefix, Token(literal_type, expression), *tokens[span[1]:]])
+            if (candidate == None):
+                continue
+            if (line_representation == None):
+                line_representation = candidate
+            if ((candidate[TUPLE_MNEMONIC], candidate[TUPLE_ADDR_MODE]) in opcode_table):
+                line_representation = candidate
+                break
+
+    if (line_representation == None):
+        diagnostics.line_error(linenum, f"Unknown addressing mode {' '.join(token.value for token in tokens)}")
+    return line_representation
+
+# Opcode table entry (opcode, argument size, undocumented) of the line's instruction and addressing mode
+def get_opcode_entry(line_representation: Tuple[str, Addr_Modes, str, int], linenum: int) -> Tuple[int, int, bool]:
+    entry: Tuple[int, int, bool] = opcode_table.get((line_representation[TUPLE_MNEMONIC], line_representation[TUPLE_ADDR_MODE]))
+    if (entry != None):
+        return entry
+    if (line_representation[TUPLE_MNEMONIC] not in instruction_mnemonics):
+        diagnostics.line_error(linenum, f"Unknown instruction '{line_representation[TUPLE_MNEMONIC]}'")
+        return None
+    diagnostics.line_error(linenum, f"Illegal Adressing Mode. Instruction'{line_representation[TUPLE_MNEMONIC]}' does not support the '{Addr_Modes_Strings[line_representation[TUPLE_ADDR_MODE].value - 1]}' addressing mode")
+    return None
+
+# Nothing is kept from a run that went wrong: the output file (unmapped first, if pass 2 was packing straight into it) and the listing are removed.
+# Nothing has been written to stdout at that point, so there is nothing to undo there
+def discard_outputs(image: MemoryImage, listing: Listing) -> None:
+    if (isinstance(image, MappedMemoryImage)):
+        image.close()
+    if (out_filename != "-"):
+        out_file.close()
+        os.remove(out_filename)
+    if (listing != None):
+        listing.out_file.close()
+        os.remove(args.listing)
 
 # --------------------------------------------------------------------------------------------------------------
 # Program starts here
 # --------------------------------------------------------------------------------------------------------------
 command_line_options: argparse.ArgumentParser = argparse.ArgumentParser(prog="UWUASM v0.2", \
     description="Yet another assembler for the 6502", \
-    usage="UWUASM v0.2 [-h] [input_file] [-o OUTPUT_FILE] [--verbose] [--help-instruction <INSTRUCTION>]")
+    usage="UWUASM v0.2 [-h] [input_file] [-o OUTPUT_FILE] [--format {bin,ihex,srec,ips,bps}] [--patch-base FILE] [--crunch ADDRESS] [--listing FILE] [--mmap-output] [--verbose] [--line-cache-size N] [--lexer {regex,scanner,buffer}] [--zero-page] [--relax-branches] [--single-pass] [--all-errors] [--mmap] [--export-symbols FILE] [--import-symbols FILE] [--help-instruction <INSTRUCTION>]")
 
 # Add input file positional argument
-command_line_options.add_argument("input_file", type=str, nargs="?", help="The input file to process. Omit this if using --help-instruction <INSTRUCTION>.")
+command_line_options.add_argument("input_file", type=str, nargs="?", help="The input file to process, or - to read it from stdin. Omit this if using --help-instruction <INSTRUCTION>.")
 # Optional output file
-command_line_options.add_argument("-o", "--output-file", type=str, default=None, help="Specify the output file. Defaults to stdout if not provided.")
+command_line_options.add_argument("-o", "--output-file", type=str, default=None, help="Specify the output file, or - to write to stdout. Defaults to a.out if not provided.")
+# Output format
+command_line_options.add_argument("--format", type=str, choices=["bin", "ihex", "srec", "ips", "bps"], default="bin", help="Output format: a flat binary starting at the lowest address used (default), Intel HEX, Motorola S-records, or an IPS or BPS patch that turns the --patch-base binary into the flat binary.")
+# Base ROM for patches
+command_line_options.add_argument("--patch-base", type=str, metavar="FILE", help="The flat binary --format ips and --format bps make a patch against, normally the output of an earlier assembly.")
+# Crunched output
+command_line_options.add_argument("--crunch", type=str, metavar="ADDRESS", help="Compress the image and output it behind a decompressor, both loaded at ADDRESS. Calling ADDRESS unpacks the image to where it was assembled. Uses zero page $F8-$FD.")
+# Listing file
+command_line_options.add_argument("--listing", type=str, metavar="FILE", help="Write a listing of every source line with the address, bytes and cycle count it assembled to. Not with --single-pass.")
+# Memory-mapped output
+command_line_options.add_argument("--mmap-output", action="store_true", help="Size the output file up front, memory-map it and assemble straight into it, instead of building the image in memory and writing it out. Only for flat binaries, and not with --single-pass.")
 # Verbose flag
 command_line_options.add_argument("--verbose", action="store_true", help="Enable verbose output.")
+# Line cache size
+command_line_options.add_argument("--line-cache-size", type=int, default=4096, metavar="N", help="Number of distinct lines to remember the parsed form of. 0 disables the cache. --verbose prints its hit rate.")
+# Tokenizer engine
+command_line_options.add_argument("--lexer", type=str, choices=["regex", "scanner", "buffer"], default="regex", help="Tokenizer engine: the per-line regex alternation (default), the single-pass hand-written scanner, or one regex pass over the whole file.")
+# Zero page optimization
+command_line_options.add_argument("--zero-page", action="store_true", help="Use the zero page form of instructions whose operand fits in zero page, and report the bytes and cycles saved.")
+# Long branch expansion
+command_line_options.add_argument("--relax-branches", action="store_true", help="Rewrite branches whose target is out of range into the inverted branch over a JMP, instead of reporting an error.")
+# Single-pass backpatching mode
+command_line_options.add_argument("--single-pass", action="store_true", help="Write each instruction as soon as it is parsed and backpatch forward references when their label is defined, instead of building the whole program before writing it. Can't be combined with --relax-branches.")
+# Collect-all-errors mode
+command_line_options.add_argument("--all-errors", action="store_true", help="Keep going after an error and report every error at the end instead of stopping at the first one. No output is written if there were any.")
+# Memory-mapped input
+command_line_options.add_argument("--mmap", action="store_true", help="Memory-map the input file and preprocess/tokenize it as bytes. Only works with the regex lexer.")
+# Symbol index files
+command_line_options.add_argument("--export-symbols", type=str, metavar="FILE", help="Write every label this assembly defines, with its final address, to a binary symbol index file.")
+command_line_options.add_argument("--import-symbols", type=str, metavar="FILE", action="append", default=[], help="Use the labels in a symbol index written by --export-symbols from another assembly. They can't be redefined. Can be given more than once.")
 # Special --help <INSTRUCTION> handling
 command_line_options.add_argument("--help-instruction", type=str, metavar="<INSTRUCTION>", help="Get detailed help for a specific instruction.")
 
 args = command_line_options.parse_args()
 
 if (args.help_instruction):
+    # The help table is big, and only needed here. Everything else uses the tables generated from it
+    from help_defs import print_instruction_help
+    from help_instruction_table import instructions
     for (idx, instruction) in enumerate(instructions):
         if (args.help_instruction.upper() == instruction.mnemonic):
             print_instruction_help(instruction)
@@ -98,6 +221,8 @@ if (args.help_instruction):
 in_file = None
 out_file = None
 
+diagnostics.collect_all = args.all_errors
+
 regex: re = regex_init()
 
 try:
@@ -114,32 +239,128 @@ try:
         out_filename = args.output_file
     extra_args = sys.argv[3:] if len(sys.argv) > 3 else []
     
-    # Open files
-    in_file = open(in_filename, 'r')
-    out_file = open(out_filename, 'wb')
+    if (args.mmap and args.lexer != "regex"):
+        error("[ERROR]: --mmap only works with the regex lexer", crash=True)
+    if (args.single_pass and args.relax_branches):
+        error("[ERROR]: --relax-branches needs the whole program before anything is written, so it can't be used with --single-pass", crash=True)
+    if (args.mmap_output and (args.single_pass or args.format != "bin")):
+        error("[ERROR]: --mmap-output needs the size of the flat binary before anything is written, so it only works with --format bin and without --single-pass", crash=True)
+
+    if (args.listing and args.single_pass):
+        error("[ERROR]: --listing is written as operands are filled in, which --single-pass does out of order, so the two can't be combined", crash=True)
+
+    base_rom: bytes = None
+    if (args.format in patch_writers):
+        if (args.patch_base == None):
+            error(f"[ERROR]: --format {args.format} needs the binary to patch, given with --patch-base", crash=True)
+        with open(args.patch_base, 'rb') as base_file:
+            base_rom = base_file.read()
+    elif (args.patch_base != None):
+        error("[ERROR]: --patch-base is only used with --format ips or --format bps", crash=True)
+
+    crunch_address: int = None
+    if (args.crunch != None):
+        if (args.mmap_output):
+            error("[ERROR]: --crunch replaces the image once it is built, so it can't be used with --mmap-output", crash=True)
+        try:
+            crunch_address = convert_value_literal(strip_value_literal(args.crunch), evaluate_value_literal(args.crunch))
+        except (TypeError, ValueError):
+            error(f"[ERROR]: Invalid --crunch address '{args.crunch}'", crash=True)
+        if (crunch_address > 0xFFFF):
+            error(f"[ERROR]: --crunch address '{args.crunch}' doesn't fit in 16 bits", crash=True)
+
+    # Open files. "-" is stdin or stdout
+    if (in_filename == "-"):
+        if (args.mmap):
+            error("[ERROR]: --mmap needs an input file, it can't map stdin", crash=True)
+        in_file = sys.stdin
+    else:
+        in_file = open(in_filename, 'rb' if args.mmap else 'r')
+    if (out_filename == "-"):
+        if (args.mmap_output):
+            error("[ERROR]: --mmap-output needs an output file, it can't map stdout", crash=True)
+        out_file = sys.stdout.buffer
+        # Everything else that gets printed goes to stderr from here on, so none of it ends up in the output
+        sys.stdout = sys.stderr
+    else:
+        out_file = open(out_filename, 'w+b' if args.mmap_output else 'wb')
 
 except FileNotFoundError as fnf_error:
     error(f"[ERROR]: File not found - {fnf_error}", crash=True)
 except Exception as e:
     error(f"[EXCEPTION]: An unexpected error occurred - {e}", crash=True)
 
-# Some lines with a label are started like this: "label: instruction". This should change that to "label:\ninstruction"
-# JMP and JSR instructions can and will be sometimes passed a label. This inserts a separator to stop it appearing as a large mnemonic once whitespace is removed
-buffer: str = in_file.read()
-buffer = re.sub(r'(\w+:)(\s*[A-Za-z])', r'\1\n\2', buffer)
-buffer = re.sub(r'\b(JMP|JSR|BCC|BCS|BEQ|BMI|BNE|BPL|BVC|BVS)\b\s*([A-Za-z0-9_]+)', r'\1, \2', buffer)
-
-# Strips out comments and splits into distinct lines, ignoring empty lines
-lines: List[str] = [line for line in re.sub(r'//[^\n]*|/\*.*?\*/', '', buffer, flags=re.DOTALL).splitlines() if line.strip()]
+# Comments are stripped, "label: instruction" lines split and jump separators inserted while the file is streamed in.
+# The source lines themselves are only kept for a listing
+listing_sources: list = [] if args.listing else None
+if (args.mmap):
+    # mmap() refuses empty files, and there would be nothing to assemble anyway
+    source_lines: Iterator[Tuple[int, bytes]] = iter(())
+    if (os.fstat(in_file.fileno()).st_size != 0):
+        source_lines = preprocess_bytes(mmap.mmap(in_file.fileno(), 0, access=mmap.ACCESS_READ), listing_sources)
+    bytes_regex: re = regex_init_bytes()
+else:
+    source_lines: Iterator[Tuple[int, str]] = preprocess(in_file, listing_sources)
 
+# Pass 1 turns every line into the compact intermediate representation, assigning each instruction its address.
+# In single-pass mode the instructions go straight into the output image instead, with forward references patched in later
 position: int = 0
-labels: List[Tuple[str, int]] = []
+labels: SymbolTable = SymbolTable()
+for index_filename in args.import_symbols:
+    labels.externals.append(SymbolIndex(index_filename))
+program: Program = SinglePassEmitter(labels) if args.single_pass else Program()
 
-for idx, line in enumerate(lines):
+# Whole-buffer mode tokenizes everything up front, each line is then just a slice of the flat token arrays
+# (this is the one mode that needs every line in memory at once)
+if (args.lexer == "buffer"):
+    source_lines = list(source_lines)
+    token_types, token_values, line_starts = tokenize_buffer([line for linenum, line in source_lines], regex_init_buffer())
+
+line_cache: LineCache = LineCache(args.line_cache_size)
+zero_page_stats: ZeroPageStats = ZeroPageStats()
+# Slots of the labels, and of the constants worked out from them. Their values can still change when branches are made long
+label_derived: Set[int] = set()
+
+for idx, (linenum, line) in enumerate(source_lines):
+
+    # Memory-mapped sources stay bytes all the way through tokenizing. The odd line with non-ASCII characters in it is decoded and takes the str path
+    if (args.mmap and not line.isascii()):
+        line = line.decode("utf-8", errors="replace")
+
+    # The regex lexer cleans the line anyway, so key on the cleaned text. The other lexers never build it separately,
+    # so they key on the stripped source line instead (two lines that strip the same always clean the same)
+    if (isinstance(line, bytes)):
+        cleaned_line: bytes = clean_line_bytes(line)
+        cache_key: bytes = cleaned_line
+    elif (args.lexer == "regex"):
+        cleaned_line: str = clean_line(line)
+        cache_key: str = cleaned_line
+    else:
+        cache_key: str = line.strip()
+
+    cached = line_cache.get(cache_key)
+    if (cached != None):
+        line_representation, entry = cached
+    else:
+        # Tokenize, then convert line into an internal representation
+        if (isinstance(line, bytes)):
+            tokens: List[Token] = tokenize_bytes(cleaned_line, bytes_regex)
+        elif (args.lexer == "buffer"):
+            tokens: List[Token] = list(map(Token, token_types[line_starts[idx]:line_starts[idx + 1]], token_values[line_starts[idx]:line_starts[idx + 1]]))
+        elif (args.lexer == "scanner"):
+            tokens: List[Token] = scan_line(line)
+        else:
+            tokens: List[Token] = tokenize(cleaned_line, regex)
+        line_representation: Tuple[str, Addr_Modes, str, int] = evaluate_line(tokens, linenum, labels)
+        if (line_representation == None):
+            continue
 
-    # Tokenize, then convert line into an internal representation
-    tokens: List[Token] = tokenize(clean_line(line), regex)
-    line_representation: Tuple[str, Addr_Modes, str, int] = evaluate_line(tokens, idx + 1)
+        entry: Tuple[int, int, bool] = None
+        if (line_representation[TUPLE_ADDR_MODE] not in (Addr_Modes.ASSEMBLER_OPTION, Addr_Modes.LABEL, Addr_Modes.CONSTANT, Addr_Modes.DIRECTIVE)):
+            entry = get_opcode_entry(line_representation, linenum)
+            if (entry == None):
+                continue
+        line_cache.put(cache_key, (line_representation, entry))
 
     # Handle assembler options
     if (line_representation[TUPLE_ADDR_MODE] == Addr_Modes.ASSEMBLER_OPTION):
@@ -151,67 +372,164 @@ for idx, line in enumerate(lines):
         finally:
             continue
     
-    # Handle labels, appending them to the list of discovered labels
+    # Handle labels, adding them to the symbol table
     if (line_representation[TUPLE_ADDR_MODE] == Addr_Modes.LABEL):
-        labels.append((line_representation[TUPLE_ARG], position))
+        if (not labels.define(line_representation[TUPLE_ARG], position, linenum)):
+            if (labels.is_external(line_representation[TUPLE_ARG])):
+                diagnostics.line_error(linenum, f"Label '{line_representation[TUPLE_ARG]}' is already defined by an imported symbol index")
+            else:
+                diagnostics.line_error(linenum, f"Label '{line_representation[TUPLE_ARG]}' is already defined on line {labels.definition_line(line_representation[TUPLE_ARG])}")
+        else:
+            program.add_label(labels.reference(line_representation[TUPLE_ARG]))
+            label_derived.add(labels.reference(line_representation[TUPLE_ARG]))
         continue
-    
-    # Handle jumps to a label, converting the label to an absolute memory address, and re-evaluating the line
-    if (line_representation[TUPLE_ADDR_MODE] == Addr_Modes.JUMP_LABEL):
-        for label in labels:
-            if (line_representation[TUPLE_ARG] == label[0]):
-                # Faking the tokens
-                tokens = [Token(TokenType.MNEMONIC, line_representation[TUPLE_MNEMONIC]), Token(TokenType.LITERAL_16BIT, f"${format(label[1], '04X')}"), Token(TokenType.EOF, "EOF")]
-                line_representation = evaluate_line(tokens, idx + 1)
-    
-    # Get index into the large instruction table
-    table_index: int = 0
-    for table_idx, addr_mode in enumerate(instruction_info[line_representation[TUPLE_MNEMONIC]][TABLE_ADDR_MODE]):
-        if (line_representation[TUPLE_ADDR_MODE] == addr_mode):
-            table_index = table_idx
-            break
+
+    # Handle constants. Their expression can only use labels and constants defined above them. It is evaluated here, and again if branch relaxation moves those labels
+    if (line_representation[TUPLE_ADDR_MODE] == Addr_Modes.CONSTANT):
+        name: str = line_representation[TUPLE_MNEMONIC]
+        value: int = line_representation[TUPLE_ARG].evaluate(labels)
+        if (value == None):
+            diagnostics.line_error(linenum, f"Constant '{name}' uses '{labels.names[line_representation[TUPLE_ARG].missing(labels)]}' before it is defined")
+        elif (not labels.define(name, value, linenum)):
+            if (labels.is_external(name)):
+                diagnostics.line_error(linenum, f"Constant '{name}' is already defined by an imported symbol index")
+            else:
+                diagnostics.line_error(linenum, f"Constant '{name}' is already defined on line {labels.definition_line(name)}")
         else:
+            program.add_constant(labels.reference(name), line_representation[TUPLE_ARG])
+            if (any(slot in label_derived for slot in line_representation[TUPLE_ARG].slots)):
+                label_derived.add(labels.reference(name))
+        continue
+
+    # Handle directives. Like constants, their operands can only use what is defined above them
+    if (line_representation[TUPLE_ADDR_MODE] == Addr_Modes.DIRECTIVE):
+        directive: str = line_representation[TUPLE_MNEMONIC]
+        values: List[int] = [operand.evaluate(labels) for operand in line_representation[TUPLE_ARG]]
+        if (None in values):
+            missing: Expression = line_representation[TUPLE_ARG][values.index(None)]
+            diagnostics.line_error(linenum, f"'{directive}' uses '{labels.names[missing.missing(labels)]}' before it is defined")
             continue
-    else:
-        error(f"[ERROR line: {idx + 1}]: Illegal Adressing Mode. Instruction'{line_representation[TUPLE_MNEMONIC]}' does not support the '{Addr_Modes_Strings[line_representation[TUPLE_ADDR_MODE].value - 1]}' addressing mode", crash=True)
-    
-    # Print a warning message if the instruction and/or addressing mode is undocumented
-    if (instruction_info[line_representation[TUPLE_MNEMONIC]][TABLE_IS_DOCUMENTED][table_idx] == True and assembler_options.get("__NO-UNDOCUMENTED-INSTRUCTION-WARNING", True) == False):
-        print(f"[WARN]: Instruction '{line_representation[TUPLE_MNEMONIC]}' with addr mode '{Addr_Modes_Strings[line_representation[TUPLE_ADDR_MODE].value - 1]}' Is undocumented and thus likely unstable. Use with caution.")
-    
-    # Write out the instruction bytecode to the output file
-    try:
-        out_file.write(struct.pack('<B', instruction_info[line_representation[TUPLE_MNEMONIC]][TABLE_BYTECODE][table_idx]))
-    except Exception as e:
-        error(f"[EXCEPTION]: An exception occurred when trying to write to the output file. Assembling cannot continue. Exception is as follows:\n{e}", crash=True)
+        if (not 0 <= values[0] <= 0xFFFF):
+            diagnostics.line_error(linenum, f"'{directive}' address {values[0]} is outside of the 6502's address space")
+            continue
+
+        # .org and .pad: everything after continues at the given address. .pad fills the gap, so it can only go forwards
+        fill: int = NO_FILL
+        if (directive == ".PAD"):
+            fill = values[1] if len(values) > 1 else 0
+            if (not 0 <= fill <= 0xFF):
+                diagnostics.line_error(linenum, f"'.PAD' fill value {fill} doesn't fit in 8 bits")
+                continue
+            if (values[0] < position):
+                diagnostics.line_error(linenum, f"'.PAD' address ${values[0]:04X} is behind the current address ${position:04X}")
+                continue
+        program.add_origin(linenum, position, values[0], fill, line_representation[TUPLE_ARG])
+        position = values[0]
+        continue
     
-    # Finally, write out the argument in little endian if one is passed
     mnemonic: str = line_representation[TUPLE_MNEMONIC]
     addr: Addr_Modes = line_representation[TUPLE_ADDR_MODE]
     arg: str = line_representation[TUPLE_ARG]
     argtype: int = line_representation[TUPLE_ARGTYPE]
 
-    if (arg != ''):
-        # Convert argument into an integer we can use
-        value: int = convert_value_literal(strip_value_literal(arg), evaluate_value_literal(arg))
-        # If instruction is a branch, calculate offset
-        if (addr == Addr_Modes.ABSOLUTE and is_mnemonic(mnemonic, "BCC", "BCS", "BEQ", "BMI", "BNE", "BPL", "BVC", "BVS") == True):
-            value = value - (position + 2)
-
-            # Check that the offset isn't out of bounds
-            if (value < -127 or value > 128):
-                error(f"[ERROR line: {idx + 1}]: Branch target out of range")
-            
-            # Write out the offset
-            out_file.write(struct.pack("<b", value))
-            position += size_in_bytes[addr]
-            continue
+    # Convert argument into an integer we can use. Jumps to a label get theirs in pass 2.
+    # Expressions using labels are evaluated now if they can be (None if not), and keep their label or compiled expression for pass 2 to resolve
+    value: int = 0
+    symbol: int = NO_SYMBOL
+    expression: Expression = None
+    if (isinstance(arg, Expression)):
+        value = arg.evaluate(labels)
+        if (arg.symbol != NO_SYMBOL):
+            symbol = arg.symbol
+        elif (arg.constant == None):
+            expression = arg
+    elif (addr == Addr_Modes.JUMP_LABEL):
+        symbol = labels.reference(arg)
+    elif (arg != ''):
+        value = convert_value_literal(strip_value_literal(arg), evaluate_value_literal(arg))
+
+    # Operands that fit in zero page get the shorter and faster zero page form when the instruction has one.
+    # Only those whose value is final: a label's address (and anything worked out from it) can still grow past $FF when branches are made long
+    final: bool = (symbol == NO_SYMBOL and expression == None) or (isinstance(arg, Expression) and not any(slot in label_derived for slot in arg.slots))
+    if (args.zero_page and final and value != None and mnemonic not in relative_branches):
+        zero_page: Tuple[int, int, bool] = zero_page_entry(mnemonic, addr, value)
+        if (zero_page != None):
+            zero_page_stats.record(mnemonic, addr, zero_page_equivalents[addr])
+            addr = zero_page_equivalents[addr]
+            argtype = zero_page[ENTRY_ARG_TYPE]
+            entry = zero_page
+
+    # Print a warning message if the instruction and/or addressing mode is undocumented
+    if (entry[ENTRY_UNDOCUMENTED] == True and assembler_options.get("__NO-UNDOCUMENTED-INSTRUCTION-WARNING", True) == False):
+        print(f"[WARN]: Instruction '{mnemonic}' with addr mode '{Addr_Modes_Strings[addr.value - 1]}' Is undocumented and thus likely unstable. Use with caution.")
+
+    # Branches take an 8 bit offset from the end of the instruction rather than the target address itself
+    if (mnemonic in relative_branches and (addr == Addr_Modes.ABSOLUTE or addr == Addr_Modes.JUMP_LABEL)):
+        encoding: int = ENCODE_RELATIVE
+    else:
+        encoding: int = ARG_TYPE_ENCODINGS[argtype]
+
+    # Operands using labels only record which symbol or expression they need, pass 2 fills in the value. This is what allows forward references
+    program.append(linenum, position, entry[ENTRY_OPCODE], encoding, 0 if value == None or symbol != NO_SYMBOL else value, symbol, expression)
 
-        # Change packing type based on the size of the argument passed
-        if (argtype != 0):
-            if (argtype == 8):
-                out_file.write(struct.pack("<B", value))
-            else:
-                out_file.write(struct.pack("<H", value))
     # Update the position so that labels work
-    position += size_in_bytes[addr]
\ No newline at end of file
+    position += ENCODING_SIZES[encoding]
+
+if (args.verbose):
+    print(line_cache)
+if (args.zero_page):
+    print(zero_page_stats)
+
+# Rewrite branches that can't reach their target into long ones before anything is written
+if (args.relax_branches):
+    expanded_branches: int = relax_branches(program, labels)
+    if (args.verbose):
+        print(f"Branch relaxation: {expanded_branches} {'branch' if expanded_branches == 1 else 'branches'} made long")
+
+listing: Listing = None
+if (args.single_pass):
+    # Everything is in the image already, apart from references to labels that were never defined
+    image: MemoryImage = program.finish()
+else:
+    # Pass 2: every label is known now, so fill in the operands that refer to one and build the image
+    # With --mmap-output the file is sized and mapped first, so pass 2 packs everything straight into it
+    # The listing is written as pass 2 goes
+    if (args.listing):
+        listing = Listing(args.listing, listing_sources)
+    image: MemoryImage = MappedMemoryImage(out_file, *image_bounds(program)) if args.mmap_output else None
+    try:
+        image = build_image(program, labels, image, listing)
+    except SystemExit:
+        # Unless every error is being collected, the first one pass 2 finds exits from in there, half way through the output and the listing
+        discard_outputs(image, listing)
+        raise
+    if (listing != None):
+        listing.finish()
+if (image != None):
+    image.check_overlaps()
+
+# Crunching swaps the image for the decompressor and the crunched stream
+cruncher: Cruncher = None
+if (crunch_address != None and len(diagnostics.errors) == 0):
+    image, cruncher = crunch_image(image, crunch_address)
+
+# Nothing is kept if anything went wrong (collect-all-errors mode, or labels single-pass mode never saw defined)
+if (len(diagnostics.errors) != 0):
+    discard_outputs(image, listing)
+    diagnostics.report()
+    exit(-1)
+
+if (cruncher != None):
+    print(cruncher)
+
+# A memory-mapped image is in the file already
+if (isinstance(image, MappedMemoryImage)):
+    image.close()
+elif (args.format in patch_writers):
+    patch_writers[args.format](image, base_rom, out_file)
+else:
+    output_writers[args.format](image, out_file)
+
+# Addresses are final now, branch relaxation included
+if (args.export_symbols):
+    export_symbols(labels, args.export_symbols)
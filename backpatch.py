@@ -0,0 +1,133 @@
+from array import array
+from typing import List, Tuple
+
+from include import diagnostics
+from ir import ENCODE_BYTE, ENCODE_WORD, ENCODE_RELATIVE, ENCODING_SIZES, NO_SYMBOL, NO_FILL, operand_fits
+from relax import branch_offset_in_range
+from emitter import OPERAND_PACKERS
+from symbols import SymbolTable
+from segments import MemoryImage
+
+# Marks the end of a chain of fixups
+NO_FIXUP = -1
+
+# Operands that name a label which isn't defined yet. One entry per operand, stored as parallel arrays.
+# The fixups waiting on the same symbol are chained together through next, starting from heads[symbol slot],
+# so defining a label patches exactly the operands that were waiting for it.
+# Operands that are an expression keep it in expressions (by fixup index), and wait on one missing label at a time.
+class FixupTable:
+    def __init__(self):
+        self.segments: array = array('L')     # Which segment of the image the operand is in
+        self.offsets: array = array('L')      # Where the operand is in that segment
+        self.encodings: array = array('B')    # ENCODE_BYTE, ENCODE_WORD or ENCODE_RELATIVE
+        self.symbols: array = array('l')      # Symbol table slot of the label
+        self.linenums: array = array('L')
+        self.next: array = array('l')
+        self.heads: dict = {}
+        self.expressions: dict = {}
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def add(self, segment: int, offset: int, encoding: int, symbol: int, linenum: int, expression=None) -> None:
+        self.segments.append(segment)
+        self.offsets.append(offset)
+        self.encodings.append(encoding)
+        self.symbols.append(symbol)
+        self.linenums.append(linenum)
+        self.next.append(NO_FIXUP)
+        if (expression != None):
+            self.expressions[len(self.offsets) - 1] = expression
+        self.wait_on(len(self.offsets) - 1, symbol)
+
+    # Puts a fixup on the chain of the symbol it waits for
+    def wait_on(self, fixup: int, symbol: int) -> None:
+        self.symbols[fixup] = symbol
+        self.next[fixup] = self.heads.get(symbol, NO_FIXUP)
+        self.heads[symbol] = fixup
+
+    # Removes and returns the indices of every fixup waiting on a symbol
+    def take(self, symbol: int) -> List[int]:
+        fixups: List[int] = []
+        fixup: int = self.heads.pop(symbol, NO_FIXUP)
+        while (fixup != NO_FIXUP):
+            fixups.append(fixup)
+            fixup = self.next[fixup]
+        return fixups
+
+# Single-pass alternative to building a Program and running pass 2.
+# Takes the same calls from the main loop as Program, but packs each instruction into an in-memory image straight away.
+# Operands naming a label that isn't known yet get a placeholder and a fixup, which is patched as soon as the label is defined
+class SinglePassEmitter:
+    def __init__(self, symbols: SymbolTable):
+        self.symbols: SymbolTable = symbols
+        self.image: MemoryImage = MemoryImage()
+        self.fixups: FixupTable = FixupTable()
+        # Instructions go at the end of the current segment, which grows as they come in
+        self.segment: int = self.image.add_segment(0, 0, 0)
+
+    def add_origin(self, linenum: int, address: int, target: int, fill: int, operands: list=[]) -> None:
+        if (fill != NO_FILL and target > address):
+            self.image.add_fill(address, target, fill, linenum)
+        self.segment = self.image.add_segment(target, 0, linenum)
+
+    def append(self, linenum: int, address: int, opcode: int, encoding: int, operand: int, symbol: int=NO_SYMBOL, expression=None) -> None:
+        data: bytearray = self.image.datas[self.segment]
+        data.append(opcode)
+        offset: int = len(data)
+        data.extend(bytes(ENCODING_SIZES[encoding] - 1))
+
+        if (symbol != NO_SYMBOL):
+            if (not self.symbols.is_defined(symbol)):
+                self.fixups.add(self.segment, offset, encoding, symbol, linenum)
+                return
+            operand = self.symbols.addresses[symbol]
+        elif (expression != None):
+            operand = expression.evaluate(self.symbols)
+            if (operand == None):
+                self.fixups.add(self.segment, offset, encoding, expression.missing(self.symbols), linenum, expression)
+                return
+        self.patch(self.segment, offset, encoding, operand, linenum)
+
+    # A label was defined: patch every operand that was waiting for it
+    def add_label(self, slot: int) -> None:
+        for fixup in self.fixups.take(slot):
+            expression = self.fixups.expressions.get(fixup)
+            if (expression == None):
+                self.patch(self.fixups.segments[fixup], self.fixups.offsets[fixup], self.fixups.encodings[fixup], self.symbols.addresses[slot], self.fixups.linenums[fixup])
+                continue
+            # Expressions can use more than one label that isn't defined yet
+            value: int = expression.evaluate(self.symbols)
+            if (value == None):
+                self.fixups.wait_on(fixup, expression.missing(self.symbols))
+                continue
+            del self.fixups.expressions[fixup]
+            self.patch(self.fixups.segments[fixup], self.fixups.offsets[fixup], self.fixups.encodings[fixup], value, self.fixups.linenums[fixup])
+
+    # Constants wait the same way labels do
+    def add_constant(self, slot: int, expression) -> None:
+        self.add_label(slot)
+
+    # Writes an operand value into a segment. Branch offsets count from the end of the instruction, which is right after its 1 byte operand
+    def patch(self, segment: int, offset: int, encoding: int, value: int, linenum: int) -> None:
+        if (not operand_fits(encoding, value)):
+            diagnostics.line_error(linenum, f"Operand value {value} doesn't fit in {'8' if encoding == ENCODE_BYTE else '16'} bits")
+        elif (encoding in (ENCODE_BYTE, ENCODE_WORD)):
+            OPERAND_PACKERS[encoding].pack_into(self.image.datas[segment], offset, value)
+        elif (encoding == ENCODE_RELATIVE):
+            value = value - (self.image.starts[segment] + offset + 1)
+            if (not branch_offset_in_range(value)):
+                diagnostics.line_error(linenum, "Branch target out of range")
+                return
+            OPERAND_PACKERS[encoding].pack_into(self.image.datas[segment], offset, value)
+
+    # End of input: every label that is still missing is reported together. Returns the finished image, or None if anything was missing
+    def finish(self) -> MemoryImage:
+        unresolved: List[Tuple[int, str]] = []
+        for symbol in list(self.fixups.heads):
+            linenums: List[int] = sorted(self.fixups.linenums[fixup] for fixup in self.fixups.take(symbol))
+            unresolved.append((linenums[0], f"Unknown label '{self.symbols.names[symbol]}' (used on {'line' if len(linenums) == 1 else 'lines'} {', '.join(str(linenum) for linenum in linenums)})"))
+        if (len(unresolved) != 0):
+            diagnostics.line_errors(unresolved)
+            return None
+        return self.image
@@ -0,0 +1,58 @@
+#!/bin/python
+# Throughput comparison of the front-end code paths
+# Usage: python bench.py [input_file] [--lines N]
+import time, argparse
+from typing import List, Callable
+
+from lexer import clean_line, tokenize, scan_line, tokenize_buffer
+from regex import regex_init, regex_init_buffer
+
+# A mix of every addressing mode, roughly what generated sources look like
+SAMPLE_LINES = [
+    "        LDA #$69",
+    "        STA $0200,X",
+    "        LDA ($10),Y",
+    "        LDX $01",
+    "        JMP ($FFFC)",
+    "        STA ($20,X)",
+    "        ADC $00",
+    "        TAY",
+    "        BNE, LOOP",
+    "LOOP:",
+]
+
+def report(name: str, lines: List[str], elapsed: float) -> float:
+    print(f"{name:<24} {len(lines) / elapsed:>14,.0f} lines/sec")
+    return elapsed
+
+def time_lines(name: str, lines: List[str], fn: Callable[[str], object]) -> float:
+    start: float = time.perf_counter()
+    for line in lines:
+        fn(line)
+    return report(name, lines, time.perf_counter() - start)
+
+def time_buffer(name: str, lines: List[str], fn: Callable[[List[str]], object]) -> float:
+    start: float = time.perf_counter()
+    fn(lines)
+    return report(name, lines, time.perf_counter() - start)
+
+command_line_options: argparse.ArgumentParser = argparse.ArgumentParser(description="Benchmark the UWUASM front-end")
+command_line_options.add_argument("input_file", type=str, nargs="?", help="Source file to benchmark with. Uses a built-in sample if omitted.")
+command_line_options.add_argument("--lines", type=int, default=200000, help="Number of sample lines when no input file is given.")
+args = command_line_options.parse_args()
+
+if (args.input_file != None):
+    with open(args.input_file, 'r') as in_file:
+        lines: List[str] = [line for line in in_file.read().splitlines() if line.strip()]
+else:
+    lines: List[str] = [SAMPLE_LINES[idx % len(SAMPLE_LINES)] for idx in range(args.lines)]
+
+regex = regex_init()
+buffer_regex = regex_init_buffer()
+
+print(f"{len(lines):,} lines")
+baseline: float = time_lines("clean_line + regex", lines, lambda line: tokenize(clean_line(line), regex))
+scanner: float = time_lines("scanner", lines, scan_line)
+whole_buffer: float = time_buffer("whole buffer", lines, lambda lines: tokenize_buffer(lines, buffer_regex))
+print(f"scanner speedup: {baseline / scanner:.2f}x")
+print(f"whole buffer speedup: {baseline / whole_buffer:.2f}x")
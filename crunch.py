@@ -0,0 +1,243 @@
+from array import array
+from typing import Dict, Tuple
+
+from include import diagnostics
+from segments import MemoryImage, FILL_BLOCK_SIZE
+
+# Crunched stream format. Every token is one byte:
+#   $00          end of the stream
+#   $01-$7F      that many literal bytes follow
+#   $80-$FF      copy (token & $7F) + MIN_MATCH bytes from the 16 bit little endian distance back that follows, counted from the current output address.
+#                The copy goes forward a byte at a time, so a distance shorter than the length repeats the bytes (runs of the same byte are distance 1)
+MAX_LITERALS = 0x7F
+MIN_MATCH = 4
+MAX_MATCH = 0x7F + MIN_MATCH
+MAX_DISTANCE = 0xFFFF
+
+# Candidates tried for each match. More finds slightly longer matches, but crunches slower
+MAX_CHAIN = 16
+
+# Zero page the decompressor works in: the stream pointer, the output pointer and the copy pointer
+SOURCE = 0xF8
+DESTINATION = 0xFA
+COPY = 0xFC
+WORKSPACE_END = COPY + 2
+
+# The decompressor, put in front of the crunched stream. It only uses relative branches, so it runs from wherever it is loaded.
+# crunch_image() fills in the address of the stream and of the output in the first 4 instructions, calling it unpacks the image and returns
+DECRUNCHER = bytes([
+    0xA9, 0x00,             #         LDA #<stream
+    0x85, SOURCE,           #         STA SOURCE
+    0xA9, 0x00,             #         LDA #>stream
+    0x85, SOURCE + 1,       #         STA SOURCE+1
+    0xA9, 0x00,             #         LDA #<destination
+    0x85, DESTINATION,      #         STA DESTINATION
+    0xA9, 0x00,             #         LDA #>destination
+    0x85, DESTINATION + 1,  #         STA DESTINATION+1
+    0xA0, 0x00,             #         LDY #0
+    0xB1, SOURCE,           # token:  LDA (SOURCE),Y
+    0xF0, 0x55,             #         BEQ done
+    0xAA,                   #         TAX
+    0xE6, SOURCE,           #         INC SOURCE
+    0xD0, 0x02,             #         BNE +2
+    0xE6, SOURCE + 1,       #         INC SOURCE+1
+    0x8A,                   #         TXA
+    0x30, 0x20,             #         BMI match
+    0xB1, SOURCE,           # literal:LDA (SOURCE),Y
+    0x91, DESTINATION,      #         STA (DESTINATION),Y
+    0xC8,                   #         INY
+    0xCA,                   #         DEX
+    0xD0, 0xF8,             #         BNE literal
+    0x98,                   #         TYA
+    0x18,                   #         CLC
+    0x65, SOURCE,           #         ADC SOURCE
+    0x85, SOURCE,           #         STA SOURCE
+    0x90, 0x02,             #         BCC +2
+    0xE6, SOURCE + 1,       #         INC SOURCE+1
+    0x98,                   # advance:TYA
+    0x18,                   #         CLC
+    0x65, DESTINATION,      #         ADC DESTINATION
+    0x85, DESTINATION,      #         STA DESTINATION
+    0x90, 0x02,             #         BCC +2
+    0xE6, DESTINATION + 1,  #         INC DESTINATION+1
+    0xA0, 0x00,             #         LDY #0
+    0xF0, 0xD2,             #         BEQ token
+    0x29, 0x7F,             # match:  AND #$7F
+    0x18,                   #         CLC
+    0x69, MIN_MATCH,        #         ADC #MIN_MATCH
+    0xAA,                   #         TAX
+    0x38,                   #         SEC
+    0xA5, DESTINATION,      #         LDA DESTINATION
+    0xF1, SOURCE,           #         SBC (SOURCE),Y
+    0x85, COPY,             #         STA COPY
+    0xC8,                   #         INY
+    0xA5, DESTINATION + 1,  #         LDA DESTINATION+1
+    0xF1, SOURCE,           #         SBC (SOURCE),Y
+    0x85, COPY + 1,         #         STA COPY+1
+    0xA5, SOURCE,           #         LDA SOURCE
+    0x18,                   #         CLC
+    0x69, 0x02,             #         ADC #2
+    0x85, SOURCE,           #         STA SOURCE
+    0x90, 0x02,             #         BCC +2
+    0xE6, SOURCE + 1,       #         INC SOURCE+1
+    0xA0, 0x00,             #         LDY #0
+    0xB1, COPY,             # copy:   LDA (COPY),Y
+    0x91, DESTINATION,      #         STA (DESTINATION),Y
+    0xC8,                   #         INY
+    0xCA,                   #         DEX
+    0xD0, 0xF8,             #         BNE copy
+    0xF0, 0xC7,             #         BEQ advance
+    0x60,                   # done:   RTS
+])
+# Offsets of the immediate operands crunch_image() fills in
+STREAM_LOW = 1
+STREAM_HIGH = 5
+DESTINATION_LOW = 9
+DESTINATION_HIGH = 13
+
+# Cycles the decompressor takes, counted from the listing above (ignoring the odd page crossing and pointer high byte increment):
+# setting up and reading the end token, each literal run and each match on top of every byte they copy, and each byte copied
+SETUP_CYCLES = 36
+LITERAL_RUN_CYCLES = 51
+MATCH_CYCLES = 91
+BYTE_CYCLES = 18
+
+# Streaming LZ encoder. Data is fed in pieces of any size, and each feed() returns the crunched bytes that are final so far.
+# Only the last MAX_DISTANCE bytes can be matched against, so that is all that is kept of what was already encoded.
+# Earlier positions are found through a hash chain on their first MIN_MATCH bytes: heads holds the latest position for each,
+# links the position before it with the same bytes (in a ring, every position in reach has its own slot)
+class Cruncher:
+    def __init__(self):
+        self.window: bytearray = bytearray()
+        self.start: int = 0                 # Stream position of window[0]
+        self.position: int = 0              # Stream position of the next byte to encode
+        self.heads: Dict[bytes, int] = {}
+        self.links: array = array('l', [-1]) * (MAX_DISTANCE + 1)
+        self.literals: bytearray = bytearray()
+        self.output: bytearray = bytearray()
+
+        self.input_size: int = 0
+        self.output_size: int = 0
+        self.cycles: int = SETUP_CYCLES
+
+    def feed(self, data: bytes) -> bytes:
+        self.window += data
+        self.input_size += len(data)
+        # Positions close to the end wait for more data, it might make their match longer
+        self.encode(self.start + len(self.window) - MAX_MATCH)
+        # Forget what is out of reach. Not after every feed, moving the window along costs a copy of it
+        if (self.position - self.start > 2 * MAX_DISTANCE):
+            drop: int = self.position - self.start - MAX_DISTANCE
+            del self.window[:drop]
+            self.start += drop
+        return self.take()
+
+    def finish(self) -> bytes:
+        self.encode(self.start + len(self.window))
+        self.flush_literals()
+        self.output.append(0x00)
+        return self.take()
+
+    def take(self) -> bytes:
+        output: bytes = bytes(self.output)
+        self.output.clear()
+        self.output_size += len(output)
+        return output
+
+    def encode(self, limit: int) -> None:
+        end: int = self.start + len(self.window)
+        while (self.position < limit):
+            distance, length = self.longest_match(min(MAX_MATCH, end - self.position))
+            if (length < MIN_MATCH):
+                self.literals.append(self.window[self.position - self.start])
+                if (len(self.literals) == MAX_LITERALS):
+                    self.flush_literals()
+                self.insert(self.position)
+                self.position += 1
+                continue
+            self.flush_literals()
+            self.output += bytes([0x80 | (length - MIN_MATCH), distance & 0xFF, distance >> 8])
+            self.cycles += MATCH_CYCLES + length * BYTE_CYCLES
+            for position in range(self.position, self.position + length):
+                self.insert(position)
+            self.position += length
+
+    # (distance, length) of the longest earlier copy of the bytes at the current position, at most limit long. Length 0 if there is none
+    def longest_match(self, limit: int) -> Tuple[int, int]:
+        if (limit < MIN_MATCH):
+            return (0, 0)
+        window: bytearray = self.window
+        current: int = self.position - self.start
+        best_distance: int = 0
+        best_length: int = 0
+        candidate: int = self.heads.get(bytes(window[current:current + MIN_MATCH]), -1)
+        for _ in range(MAX_CHAIN):
+            if (candidate == -1 or self.position - candidate > MAX_DISTANCE):
+                break
+            earlier: int = candidate - self.start
+            # Only a longer match is any use, and the byte past the best one so far is where most candidates differ
+            if (window[earlier + best_length] == window[current + best_length]):
+                if (window[earlier:earlier + limit] == window[current:current + limit]):
+                    return (self.position - candidate, limit)
+                length: int = 0
+                while (window[earlier + length] == window[current + length]):
+                    length += 1
+                if (length > best_length):
+                    best_distance, best_length = self.position - candidate, length
+            candidate = self.links[candidate & MAX_DISTANCE]
+        return (best_distance, best_length)
+
+    def insert(self, position: int) -> None:
+        offset: int = position - self.start
+        if (offset + MIN_MATCH > len(self.window)):
+            return
+        key: bytes = bytes(self.window[offset:offset + MIN_MATCH])
+        self.links[position & MAX_DISTANCE] = self.heads.get(key, -1)
+        self.heads[key] = position
+
+    def flush_literals(self) -> None:
+        if (len(self.literals) == 0):
+            return
+        self.output.append(len(self.literals))
+        self.output += self.literals
+        self.cycles += LITERAL_RUN_CYCLES + len(self.literals) * BYTE_CYCLES
+        self.literals.clear()
+
+    def __str__(self):
+        return f"Crunched {self.input_size} bytes to {self.output_size} bytes ({100 * self.output_size // max(self.input_size, 1)}%) plus a {len(DECRUNCHER)} byte decompressor, unpacking takes about {self.cycles} cycles"
+
+# Crunches the image (lowest to highest address, gaps as zeros, like a flat binary) and returns an image holding the decompressor
+# followed by the crunched stream, loaded at load_address. Calling load_address unpacks the original image back to its own addresses
+def crunch_image(image: MemoryImage, load_address: int) -> Tuple[MemoryImage, Cruncher]:
+    base, end = image.bounds()
+    cruncher: Cruncher = Cruncher()
+    stream: bytearray = bytearray()
+    position: int = base
+    for address, data in image.chunks():
+        while (position < address):
+            gap: int = min(FILL_BLOCK_SIZE, address - position)
+            stream += cruncher.feed(bytes(gap))
+            position += gap
+        stream += cruncher.feed(data)
+        position = address + len(data)
+    stream += cruncher.finish()
+
+    crunched: MemoryImage = MemoryImage()
+    segment: bytearray = crunched.datas[crunched.add_segment(load_address, len(DECRUNCHER) + len(stream), 0)]
+    segment[:len(DECRUNCHER)] = DECRUNCHER
+    segment[len(DECRUNCHER):] = stream
+    stream_address: int = load_address + len(DECRUNCHER)
+    segment[STREAM_LOW], segment[STREAM_HIGH] = stream_address & 0xFF, (stream_address >> 8) & 0xFF
+    segment[DESTINATION_LOW], segment[DESTINATION_HIGH] = base & 0xFF, (base >> 8) & 0xFF
+
+    # The decompressor only has 16 bit pointers, and can't unpack over itself, the stream it is reading or the zero page pointers it works with
+    load_end: int = load_address + len(segment)
+    if (end > 0x10000 or load_end > 0x10000):
+        diagnostics.line_errors([(0, f"Crunched images have to fit in 64K, the image is at ${base:04X}-${end - 1:04X} and the crunched image at ${load_address:04X}-${load_end - 1:04X}")])
+    elif (load_address < end and base < load_end):
+        diagnostics.line_errors([(0, f"The crunched image at ${load_address:04X}-${load_end - 1:04X} overlaps the image it unpacks to at ${base:04X}-${end - 1:04X}")])
+    elif (base < WORKSPACE_END and SOURCE < end):
+        diagnostics.line_errors([(0, f"The image at ${base:04X}-${end - 1:04X} covers ${SOURCE:02X}-${WORKSPACE_END - 1:02X}, the zero page the decompressor works in")])
+    elif (load_address < WORKSPACE_END and SOURCE < load_end):
+        diagnostics.line_errors([(0, f"The crunched image at ${load_address:04X}-${load_end - 1:04X} covers ${SOURCE:02X}-${WORKSPACE_END - 1:02X}, the zero page the decompressor works in")])
+    return (crunched, cruncher)
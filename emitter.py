@@ -0,0 +1,129 @@
+import sys, struct
+from typing import BinaryIO, List, Tuple
+
+from include import error, diagnostics
+from ir import Program, ENCODING_SIZES, ENCODE_NONE, ENCODE_BYTE, ENCODE_WORD, ENCODE_RELATIVE, ENCODE_LONG_BRANCH, ENCODE_ORIGIN, NO_SYMBOL, NO_FILL, operand_fits
+from relax import branch_offset_in_range
+from symbols import SymbolTable
+from segments import MemoryImage
+from listing import Listing
+
+# Packers for each operand encoding, compiled once instead of parsing the format string for every instruction
+OPCODE_PACKER = struct.Struct("<B")
+OPERAND_PACKERS = {
+    ENCODE_BYTE:     struct.Struct("<B"),
+    ENCODE_WORD:     struct.Struct("<H"),
+    ENCODE_RELATIVE: struct.Struct("<b"),
+}
+# The inverted branch, its offset over the JMP, then the JMP to the real target
+LONG_BRANCH_PACKER = struct.Struct("<BbBH")
+
+# (start, end, fill byte, line number) of every range pass 2 puts in the image, in program order.
+# Each run of instructions between origins (.org/.pad) is one range with fill byte NO_FILL, the gap a .pad fills is one with its fill byte
+def image_layout(program: Program) -> List[Tuple[int, int, int, int]]:
+    # Where each run of instructions ends: the address of the origin that closes it, or the end of the program for the last one
+    segment_ends: List[int] = [program.addresses[origin] for origin in program.origins] + [program.end_address]
+    layout: List[Tuple[int, int, int, int]] = [(0, segment_ends[0], NO_FILL, 0)]
+    for number, origin in enumerate(program.origins):
+        target: int = program.operands[origin]
+        if (origin in program.fills and target > program.addresses[origin]):
+            layout.append((program.addresses[origin], target, program.fills[origin], program.linenums[origin]))
+        layout.append((target, segment_ends[number + 1], NO_FILL, program.linenums[origin]))
+    return layout
+
+# Lowest and one past the highest address the image of a program will hold. (0, 0) if it holds nothing
+def image_bounds(program: Program) -> Tuple[int, int]:
+    ranges: List[Tuple[int, int, int, int]] = [entry for entry in image_layout(program) if entry[1] > entry[0]]
+    if (len(ranges) == 0):
+        return (0, 0)
+    return (min(entry[0] for entry in ranges), max(entry[1] for entry in ranges))
+
+# Pass 2: fills in the operands that refer to labels and packs every instruction into the program's image.
+# Everything else was worked out by pass 1, so nothing is tokenized or parsed again here.
+# Every segment is allocated at its final size up front, and every instruction goes straight to its place in it.
+# image can be passed in to pack into something other than a new MemoryImage, like the memory-mapped output file.
+# With a listing, each instruction's row is written as soon as it is packed
+def build_image(program: Program, symbols: SymbolTable, image: MemoryImage=None, listing: Listing=None) -> MemoryImage:
+    if (image == None):
+        image = MemoryImage()
+    segments: List[int] = []
+    for start, end, fill, linenum in image_layout(program):
+        if (fill == NO_FILL):
+            segments.append(image.add_segment(start, end - start, linenum))
+        else:
+            image.add_fill(start, end, fill, linenum)
+    segment_number: int = 0
+    segment_start: int = image.starts[segments[0]]
+    segment = image.datas[segments[0]]
+
+    for idx in range(len(program)):
+        encoding: int = program.encodings[idx]
+        value: int = program.operands[idx]
+        address: int = program.addresses[idx]
+
+        # .org and .pad move on to the next segment
+        if (encoding == ENCODE_ORIGIN):
+            segment_number += 1
+            segment_start = image.starts[segments[segment_number]]
+            segment = image.datas[segments[segment_number]]
+            if (listing != None):
+                listing.origin(program.linenums[idx], value)
+            continue
+
+        # Resolve labels, now that all of them are known
+        symbol: int = program.symbols[idx]
+        if (symbol != NO_SYMBOL):
+            if (not symbols.is_defined(symbol)):
+                diagnostics.line_error(program.linenums[idx], f"Unknown label '{symbols.names[symbol]}'")
+                continue
+            value = symbols.addresses[symbol]
+        elif (idx in program.expressions):
+            value = program.expressions[idx].evaluate(symbols)
+            if (value == None):
+                diagnostics.line_error(program.linenums[idx], f"Unknown label '{symbols.names[program.expressions[idx].missing(symbols)]}'")
+                continue
+
+        # If instruction is a branch, calculate offset
+        if (encoding == ENCODE_RELATIVE):
+            value = value - (address + 2)
+
+            # Check that the offset isn't out of bounds
+            if (not branch_offset_in_range(value)):
+                diagnostics.line_error(program.linenums[idx], "Branch target out of range (--relax-branches rewrites these into a branch over a JMP)")
+                continue
+        elif (not operand_fits(encoding, value)):
+            diagnostics.line_error(program.linenums[idx], f"Operand value {value} doesn't fit in {'8' if encoding == ENCODE_BYTE else '16'} bits")
+            continue
+
+        # Pack the instruction bytecode, then the argument in little endian if there is one
+        if (encoding == ENCODE_LONG_BRANCH):
+            # The opposite condition skips the 3 byte JMP to the real target. Flipping bit 5 of a branch opcode inverts its condition
+            LONG_BRANCH_PACKER.pack_into(segment, address - segment_start, program.opcodes[idx] ^ 0x20, 3, 0x4C, value)
+        else:
+            OPCODE_PACKER.pack_into(segment, address - segment_start, program.opcodes[idx])
+            if (encoding != ENCODE_NONE):
+                OPERAND_PACKERS[encoding].pack_into(segment, address - segment_start + 1, value)
+
+        if (listing != None):
+            listing.instruction(program.linenums[idx], address, segment[address - segment_start:address - segment_start + ENCODING_SIZES[encoding]], program.opcodes[idx], encoding == ENCODE_LONG_BRANCH)
+    return image
+
+# Writes the image as a flat binary starting at its lowest address. Each segment and fill goes out with a single write,
+# gaps nobody filled are skipped over with a seek, so they cost neither memory nor write time (the file system leaves a hole, which reads as zeros).
+# Offsets count from wherever the file was when this started, so nothing already in it is written over.
+# Stdout (even when it is redirected to a file) and pipes get the flat binary put together in memory first, and in one write
+def write_image(image: MemoryImage, out_file: BinaryIO) -> None:
+    base: int = image.bounds()[0]
+    try:
+        if (not out_file.seekable() or (sys.__stdout__ != None and out_file is sys.__stdout__.buffer)):
+            out_file.write(image.flatten())
+            out_file.flush()
+            return
+
+        start: int = out_file.tell()
+        for address, data in image.chunks():
+            if (out_file.tell() != start + address - base):
+                out_file.seek(start + address - base)
+            out_file.write(data)
+    except Exception as e:
+        error(f"[EXCEPTION]: An exception occurred when trying to write to the output file. Assembling cannot continue. Exception is as follows:\n{e}", crash=True)
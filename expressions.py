@@ -0,0 +1,153 @@
+from typing import List, Tuple
+
+from include import Token, TokenType
+from ir import NO_SYMBOL
+from symbols import SymbolTable
+from value_literal import evaluate_value_literal, strip_value_literal, convert_value_literal
+
+# Bytecode instructions. Expressions are compiled into a flat list of (instruction, argument) pairs run on a small stack
+PUSH_CONSTANT = 0
+PUSH_SYMBOL   = 1
+ADD           = 2
+SUBTRACT      = 3
+NEGATE        = 4
+LOW_BYTE      = 5
+HIGH_BYTE     = 6
+
+# Tokens that can make up an expression
+expression_token_types = (TokenType.LITERAL_8BIT, TokenType.LITERAL_16BIT, TokenType.MNEMONIC, TokenType.OPERATOR)
+
+binary_operators = {"+": ADD, "-": SUBTRACT}
+# '<' and '>' take the low or high byte of everything after them, so "<table+2" is the low byte of table+2
+byte_operators = {"<": LOW_BYTE, ">": HIGH_BYTE}
+
+def apply_operator(instruction: int, left: int, right: int=0) -> int:
+    if (instruction == ADD):
+        return left + right
+    if (instruction == SUBTRACT):
+        return left - right
+    if (instruction == NEGATE):
+        return -left
+    if (instruction == LOW_BYTE):
+        return left & 0xFF
+    return (left >> 8) & 0xFF
+
+# An operand or constant definition, compiled once when its line is first parsed (the line cache keeps it for every other line that reads the same).
+# Parts that don't depend on a label are folded at compile time: an expression that is just a value keeps only that value,
+# one that is just a label keeps its symbol slot (so it can go through the same paths as a plain label), and anything else keeps its bytecode.
+# Results are remembered until the symbol table next changes, so repeated evaluations of the same expression are a single comparison
+class Expression:
+    def __init__(self, code: List[Tuple[int, int]], slots: List[int]):
+        self.code: List[Tuple[int, int]] = code
+        self.slots: List[int] = slots
+        self.constant: int = code[0][1] if len(code) == 1 and code[0][0] == PUSH_CONSTANT else None
+        self.symbol: int = code[0][1] if len(code) == 1 and code[0][0] == PUSH_SYMBOL else NO_SYMBOL
+        self.generation: int = -1
+        self.value: int = None
+
+    # Value of the expression, or None if a label it uses isn't defined yet
+    def evaluate(self, symbols: SymbolTable) -> int:
+        if (self.constant != None):
+            return self.constant
+        if (self.generation == symbols.generation):
+            return self.value
+
+        value: int = None
+        if (self.missing(symbols) == NO_SYMBOL):
+            stack: List[int] = []
+            for instruction, argument in self.code:
+                if (instruction == PUSH_CONSTANT):
+                    stack.append(argument)
+                elif (instruction == PUSH_SYMBOL):
+                    stack.append(symbols.addresses[argument])
+                elif (instruction in (NEGATE, LOW_BYTE, HIGH_BYTE)):
+                    stack.append(apply_operator(instruction, stack.pop()))
+                else:
+                    right: int = stack.pop()
+                    stack.append(apply_operator(instruction, stack.pop(), right))
+            value = stack[0]
+
+        self.generation = symbols.generation
+        self.value = value
+        return value
+
+    # Slot of the first label the expression uses that isn't defined yet, NO_SYMBOL if there is none
+    def missing(self, symbols: SymbolTable) -> int:
+        for slot in self.slots:
+            if (not symbols.is_defined(slot)):
+                return slot
+        return NO_SYMBOL
+
+# Expression grammar, lowest precedence first:
+#   expression := '<' expression | '>' expression | sum
+#   sum        := factor (('+' | '-') factor)*
+#   factor     := '-' factor | value literal | label
+# The tree is built as nested tuples: ("constant", value), ("symbol", slot), (instruction, operand) or (instruction, left, right)
+class ExpressionParser:
+    def __init__(self, tokens: List[Token], symbols: SymbolTable):
+        self.tokens: List[Token] = tokens
+        self.symbols: SymbolTable = symbols
+        self.idx: int = 0
+
+    def accept_operator(self, operators: dict) -> int:
+        if (self.idx < len(self.tokens) and self.tokens[self.idx].type == TokenType.OPERATOR and self.tokens[self.idx].value in operators):
+            self.idx += 1
+            return operators[self.tokens[self.idx - 1].value]
+        return None
+
+    def expression(self) -> tuple:
+        instruction: int = self.accept_operator(byte_operators)
+        if (instruction != None):
+            return fold((instruction, self.expression()))
+        return self.sum()
+
+    def sum(self) -> tuple:
+        node: tuple = self.factor()
+        instruction: int = self.accept_operator(binary_operators)
+        while (instruction != None):
+            node = fold((instruction, node, self.factor()))
+            instruction = self.accept_operator(binary_operators)
+        return node
+
+    def factor(self) -> tuple:
+        if (self.accept_operator({"-": NEGATE}) != None):
+            return fold((NEGATE, self.factor()))
+        if (self.idx >= len(self.tokens)):
+            raise ValueError("Expression ends where a value or label was expected")
+        token: Token = self.tokens[self.idx]
+        self.idx += 1
+        if (token.type in (TokenType.LITERAL_8BIT, TokenType.LITERAL_16BIT)):
+            return ("constant", convert_value_literal(strip_value_literal(token.value), evaluate_value_literal(token.value)))
+        if (token.type == TokenType.MNEMONIC):
+            return ("symbol", self.symbols.reference(token.value))
+        raise ValueError(f"Unexpected '{token.value}' in expression")
+
+# Constant folding: an operator whose operands are all known at compile time is replaced by its result
+def fold(node: tuple) -> tuple:
+    if (all(operand[0] == "constant" for operand in node[1:])):
+        return ("constant", apply_operator(node[0], *(operand[1] for operand in node[1:])))
+    return node
+
+# Flattens the tree into bytecode, operands before their operator
+def generate(node: tuple, code: List[Tuple[int, int]], slots: List[int]) -> None:
+    if (node[0] == "constant"):
+        code.append((PUSH_CONSTANT, node[1]))
+    elif (node[0] == "symbol"):
+        code.append((PUSH_SYMBOL, node[1]))
+        if (node[1] not in slots):
+            slots.append(node[1])
+    else:
+        for operand in node[1:]:
+            generate(operand, code, slots)
+        code.append((node[0], 0))
+
+# Compiles the tokens of an expression. Raises ValueError with a message describing the problem if they aren't one
+def compile_expression(tokens: List[Token], symbols: SymbolTable) -> Expression:
+    parser: ExpressionParser = ExpressionParser(tokens, symbols)
+    tree: tuple = parser.expression()
+    if (parser.idx != len(tokens)):
+        raise ValueError(f"Unexpected '{tokens[parser.idx].value}' in expression")
+    code: List[Tuple[int, int]] = []
+    slots: List[int] = []
+    generate(tree, code, slots)
+    return Expression(code, slots)
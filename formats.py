@@ -0,0 +1,67 @@
+from typing import BinaryIO, Iterator, Tuple
+
+from include import error
+from emitter import write_image
+from segments import MemoryImage
+
+# Data bytes per record. 16 is what nearly every programmer and bootloader expects
+RECORD_SIZE = 16
+
+# Splits the image into (address, data) pieces of at most RECORD_SIZE bytes that never cross a 64K boundary
+def records(image: MemoryImage) -> Iterator[Tuple[int, memoryview]]:
+    for address, data in image.chunks():
+        offset: int = 0
+        while (offset < len(data)):
+            size: int = min(RECORD_SIZE, len(data) - offset, 0x10000 - ((address + offset) & 0xFFFF))
+            yield (address + offset, data[offset:offset + size])
+            offset += size
+
+# Both formats use the two's complement (Intel) or one's complement (Motorola) of the low byte of the sum of every byte in the record
+def intel_hex_record(record_type: int, address: int, data: bytes) -> bytes:
+    record: bytes = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, record_type]) + data
+    return b":" + (record + bytes([-sum(record) & 0xFF])).hex().upper().encode("ascii") + b"\n"
+
+def srecord(record_type: int, address: int, address_size: int, data: bytes) -> bytes:
+    record: bytes = bytes([address_size + len(data) + 1]) + address.to_bytes(address_size, "big") + data
+    return b"S" + str(record_type).encode("ascii") + (record + bytes([~sum(record) & 0xFF])).hex().upper().encode("ascii") + b"\n"
+
+# Intel HEX: one data record per piece, an extended linear address record whenever the upper 16 bits of the address change, then the end of file record.
+# Records go out as they are made, the file is never built up in memory
+def write_intel_hex(image: MemoryImage, out_file: BinaryIO) -> None:
+    try:
+        upper: int = 0
+        for address, data in records(image):
+            if (address >> 16 != upper):
+                upper = address >> 16
+                out_file.write(intel_hex_record(0x04, 0, upper.to_bytes(2, "big")))
+            out_file.write(intel_hex_record(0x00, address & 0xFFFF, data))
+        out_file.write(intel_hex_record(0x01, 0, b""))
+    except Exception as e:
+        error(f"[EXCEPTION]: An exception occurred when trying to write to the output file. Assembling cannot continue. Exception is as follows:\n{e}", crash=True)
+
+# Motorola S-records: a header, S1 data records (S2 with 24 bit addresses if anything is above $FFFF), a count record (S5, or S6 with a 24 bit count past 65535 records),
+# then the termination record.
+# Records go out as they are made, the file is never built up in memory
+def write_srecord(image: MemoryImage, out_file: BinaryIO) -> None:
+    wide: bool = image.bounds()[1] > 0x10000
+    address_size: int = 3 if wide else 2
+    try:
+        out_file.write(srecord(0, 0, 2, b"UWUASM"))
+        count: int = 0
+        for address, data in records(image):
+            out_file.write(srecord(2 if wide else 1, address, address_size, data))
+            count += 1
+        if (count <= 0xFFFF):
+            out_file.write(srecord(5, count, 2, b""))
+        else:
+            out_file.write(srecord(6, count, 3, b""))
+        out_file.write(srecord(8 if wide else 9, 0, address_size, b""))
+    except Exception as e:
+        error(f"[EXCEPTION]: An exception occurred when trying to write to the output file. Assembling cannot continue. Exception is as follows:\n{e}", crash=True)
+
+# Output format name -> writer
+output_writers = {
+    "bin":  write_image,
+    "ihex": write_intel_hex,
+    "srec": write_srecord,
+}
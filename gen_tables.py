@@ -0,0 +1,16 @@
+#!/bin/python
+# Checks the help table (help_instruction_table.py), the one place instruction data is written down, for mistakes,
+# then rebuilds the instruction table cache that tables.py loads at startup.
+# tables.py rebuilds the cache by itself whenever the help table changes, this is for checking an edit and for writing the cache ahead of time
+# Usage: python gen_tables.py
+from help_instruction_table import instructions
+from tables import check_instructions, write_instruction_cache, instruction_sources_fingerprint, INSTRUCTION_CACHE
+
+problems = check_instructions(instructions)
+for problem in problems:
+    print(f"[ERROR]: {problem}")
+if (len(problems) != 0):
+    exit(1)
+
+instruction_mnemonics, opcode_table, base_cycles, opcode_cycles = write_instruction_cache(instruction_sources_fingerprint())
+print(f"{len(instruction_mnemonics)} instructions, {len(opcode_table)} (mnemonic, addressing mode) pairs and {len(opcode_cycles)} opcodes written to {INSTRUCTION_CACHE}")
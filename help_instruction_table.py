@@ -130,15 +130,15 @@ HelpMessage("LDY",
         ],
         "Load the index register Y from memory\n\
         \n\
-        LDX does not affect the C or V flags; sets Z if the value loaded was zero, otherwise resets it; sets N if\n\
+        LDY does not affect the C or V flags; sets Z if the value loaded was zero, otherwise resets it; sets N if\n\
         the value loaded in bit 7 is a 1; otherwise N is reset, and only affects the Y register.",
         5,
         [
             [AddressingModes.IMMEDIATE          , 0xA0, 2, "2", False],
             [AddressingModes.ABSOLUTE           , 0xAC, 3, "4", False],
-            [AddressingModes.Y_INDEXED_ABSOLUTE , 0xBC, 3, "4+p | p=1 if page boundary crossed", False],
+            [AddressingModes.X_INDEXED_ABSOLUTE , 0xBC, 3, "4+p | p=1 if page boundary crossed", False],
             [AddressingModes.ZERO_PAGE          , 0xA4, 2, "3", False],
-            [AddressingModes.Y_INDEXED_ZERO_PAGE, 0xB4, 2, "4", False],
+            [AddressingModes.X_INDEXED_ZERO_PAGE, 0xB4, 2, "4", False],
         ],
     ),
 HelpMessage("SAX",
@@ -243,7 +243,7 @@ HelpMessage("SHY",
         No flags or registers in the microprocessor are affected by the store operation.",
         1,
         [
-            [AddressingModes.Y_INDEXED_ABSOLUTE, 0x9C, 3, "5", True],
+            [AddressingModes.X_INDEXED_ABSOLUTE, 0x9C, 3, "5", True],
         ],
     ),
 HelpMessage("STA",
@@ -301,7 +301,7 @@ HelpMessage("STX",
         ],
     ),
 HelpMessage("STY",
-        "Store index X register in memory",
+        "Store index Y register in memory",
         "Y -> M",
         "Load",
         [
@@ -322,7 +322,7 @@ HelpMessage("STY",
         [
             [AddressingModes.ABSOLUTE           , 0x8C, 3, "4", False],
             [AddressingModes.ZERO_PAGE          , 0x84, 2, "3", False],
-            [AddressingModes.Y_INDEXED_ZERO_PAGE, 0x94, 2, "4", False],
+            [AddressingModes.X_INDEXED_ZERO_PAGE, 0x94, 2, "4", False],
         ],
     ),
 HelpMessage("SHS",
@@ -1151,13 +1151,13 @@ HelpMessage("RLA",
         negative flag.",
         7,
         [
-            [AddressingModes.ABSOLUTE                    , 0x2F, 3, "6", False],
-            [AddressingModes.X_INDEXED_ABSOLUTE          , 0x3F, 3, "7", False],
-            [AddressingModes.Y_INDEXED_ABSOLUTE          , 0x3B, 3, "7", False],
-            [AddressingModes.ZERO_PAGE                   , 0x27, 2, "5", False],
-            [AddressingModes.X_INDEXED_ZERO_PAGE         , 0x37, 2, "6", False],
-            [AddressingModes.X_INDEXED_ZERO_PAGE_INDIRECT, 0x23, 2, "8", False],
-            [AddressingModes.ZERO_PAGE_INDIRECT_Y_INDEXED, 0x33, 2, "8", False],
+            [AddressingModes.ABSOLUTE                    , 0x2F, 3, "6", True],
+            [AddressingModes.X_INDEXED_ABSOLUTE          , 0x3F, 3, "7", True],
+            [AddressingModes.Y_INDEXED_ABSOLUTE          , 0x3B, 3, "7", True],
+            [AddressingModes.ZERO_PAGE                   , 0x27, 2, "5", True],
+            [AddressingModes.X_INDEXED_ZERO_PAGE         , 0x37, 2, "6", True],
+            [AddressingModes.X_INDEXED_ZERO_PAGE_INDIRECT, 0x23, 2, "8", True],
+            [AddressingModes.ZERO_PAGE_INDIRECT_Y_INDEXED, 0x33, 2, "8", True],
         ],
     ),
 HelpMessage("RRA",
@@ -1312,13 +1312,13 @@ HelpMessage("SRE",
         and reset otherwise. The carry is set equal to input bit 0.",
         7,
         [
-            [AddressingModes.ABSOLUTE                    , 0x0F, 3, "6", True],
-            [AddressingModes.X_INDEXED_ABSOLUTE          , 0x1F, 3, "7", True],
-            [AddressingModes.Y_INDEXED_ABSOLUTE          , 0x1B, 3, "7", True],
-            [AddressingModes.ZERO_PAGE                   , 0x07, 2, "5", True],
-            [AddressingModes.X_INDEXED_ZERO_PAGE         , 0x17, 2, "6", True],
-            [AddressingModes.X_INDEXED_ZERO_PAGE_INDIRECT, 0x03, 2, "8", True],
-            [AddressingModes.ZERO_PAGE_INDIRECT_Y_INDEXED, 0x13, 2, "8", True],
+            [AddressingModes.ABSOLUTE                    , 0x4F, 3, "6", True],
+            [AddressingModes.X_INDEXED_ABSOLUTE          , 0x5F, 3, "7", True],
+            [AddressingModes.Y_INDEXED_ABSOLUTE          , 0x5B, 3, "7", True],
+            [AddressingModes.ZERO_PAGE                   , 0x47, 2, "5", True],
+            [AddressingModes.X_INDEXED_ZERO_PAGE         , 0x57, 2, "6", True],
+            [AddressingModes.X_INDEXED_ZERO_PAGE_INDIRECT, 0x43, 2, "8", True],
+            [AddressingModes.ZERO_PAGE_INDIRECT_Y_INDEXED, 0x53, 2, "8", True],
         ],
     ),
 HelpMessage("XXA",
@@ -1918,7 +1918,7 @@ HelpMessage("CLV",
         CLV affects no registers in the microprocessor and no flags other than the overflow flag which is set to a 0.",
         1,
         [
-            [AddressingModes.IMPLIED, 0x58, 1, "2", False],
+            [AddressingModes.IMPLIED, 0xB8, 1, "2", False],
         ],
     ),
 HelpMessage("SEC",
@@ -1991,6 +1991,40 @@ HelpMessage("SEI",
             [AddressingModes.IMPLIED, 0x78, 1, "2", False],
         ],
     ),
+HelpMessage("JAM",
+        "Halt the processor",
+        "Stop execution",
+        "Ctrl",
+        [
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+            Flag.NOT_AFFECTED,
+        ],
+        "The undocumented JAM instructions stop the processor dead: the bus is left fetching the same address and\n\
+        neither interrupts nor NMI are serviced. Only a reset gets it going again.\n\
+        \n\
+        All twelve opcodes do the same thing.",
+        12,
+        [
+            [AddressingModes.IMPLIED, 0x02, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x12, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x22, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x32, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x42, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x52, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x62, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x72, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0x92, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0xB2, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0xD2, 1, "- | the processor halts", True],
+            [AddressingModes.IMPLIED, 0xF2, 1, "- | the processor halts", True],
+        ],
+    ),
 HelpMessage("NOP",
         "No operation",
         "No operation",
@@ -1,4 +1,6 @@
+import sys
 from enum import Enum
+from typing import List, Tuple
 
 # Make handling tuples easier when dealing with the result from evaluate_line().
 TUPLE_MNEMONIC = 0
@@ -6,23 +8,50 @@ TUPLE_ADDR_MODE = 1
 TUPLE_ARG = 2
 TUPLE_ARGTYPE = 3
 
-# Make handling the instruction table easier
-TABLE_ADDR_MODE = 0
-TABLE_BYTECODE = 1
-TABLE_IS_DOCUMENTED = 2
+# Make handling the entries of the (mnemonic, addressing mode) opcode table easier
+ENTRY_OPCODE = 0
+ENTRY_ARG_TYPE = 1
+ENTRY_UNDOCUMENTED = 2
 
 def error(msg: str, code: int=1, crash: bool=False) -> None:
-    print(f"[ERROR][-{code}]: {msg}")
+    print(f"[ERROR][-{code}]: {msg}", file=sys.stderr)
     if (crash):
         exit(-code)
 
+# Errors tied to a source line go through here. Normally the first one exits like error(..., crash=True) always has,
+# but in collect-all-errors mode they are recorded, assembling carries on with the next line, and report() lists them all at the end
+class Diagnostics:
+    def __init__(self):
+        self.collect_all: bool = False
+        self.errors: List[Tuple[int, str]] = []
+
+    def line_error(self, linenum: int, msg: str) -> None:
+        if (not self.collect_all):
+            error(f"[ERROR line: {linenum}]: {msg}", crash=True)
+        self.errors.append((linenum, msg))
+
+    # Several errors found at once at the end of assembling. These are always reported together, even when not collecting every error
+    def line_errors(self, errors: List[Tuple[int, str]]) -> None:
+        self.errors.extend(errors)
+
+    def report(self) -> None:
+        # Pass 2 finds its errors after pass 1 is done with the whole file, so put them back in line order
+        for linenum, msg in sorted(self.errors, key=lambda entry: entry[0]):
+            error(f"[ERROR line: {linenum}]: {msg}")
+        print(f"{len(self.errors)} {'error' if len(self.errors) == 1 else 'errors'} found, no output written")
+
+diagnostics = Diagnostics()
+
 class Token:
-    def __init__(self, token_type, value):
+    # Tokens are created for every lexeme of every line, so skip the per-instance __dict__
+    __slots__ = ("type", "value")
+
+    def __init__(self, token_type: int, value: str):
         self.type = token_type
         self.value = value
 
     def __str__(self):
-        return f"Token: {self.type} ({self.value})"
+        return f"Token: {TokenType_Strings[self.type]} ({self.value})"
 
 class Addr_Modes(Enum):
     IMPLIED                      = 1
@@ -40,6 +69,8 @@ class Addr_Modes(Enum):
     ASSEMBLER_OPTION             = 13
     LABEL                        = 14
     JUMP_LABEL                   = 15
+    CONSTANT                     = 16
+    DIRECTIVE                    = 17
 
 Addr_Modes_Strings = [
     "IMPLIED",
@@ -57,22 +88,51 @@ Addr_Modes_Strings = [
     "ASSEMBLER_OPTION",
     "LABEL",
     "JUMP_LABEL",
+    "CONSTANT",
+    "DIRECTIVE",
 ]
 
+# Token types are small integers so matching token sequences compares ints, not strings.
+# Use TokenType_Strings for their readable names (they are also the regex group names)
 class TokenType:
-    MNEMONIC                     = "MNEMONIC"
-    LITERAL_8BIT                 = "LITERAL_8BIT"
-    LITERAL_16BIT                = "LITERAL_16BIT"
-    HASH                         = "HASH"
-    OPENING_BRACKET              = "OPENING_BRACKET"
-    CLOSING_BRACKET              = "CLOSING_BRACKET"
-    COMMA                        = "COMMA"
-    EQUALS                       = "EQUALS"
-    ASSEMBLER_OPTION             = "ASSEMBLER_OPTION"
-    OPT                          = "OPT"
-    COLON                        = "COLON"
-    UNKNOWN                      = "UNKNOWN"
-    EOF                          = "EOF"
+    MNEMONIC                     = 0
+    LITERAL_8BIT                 = 1
+    LITERAL_16BIT                = 2
+    HASH                         = 3
+    OPENING_BRACKET              = 4
+    CLOSING_BRACKET              = 5
+    COMMA                        = 6
+    EQUALS                       = 7
+    ASSEMBLER_OPTION             = 8
+    OPT                          = 9
+    COLON                        = 10
+    UNKNOWN                      = 11
+    EOF                          = 12
+    EOL                          = 13                     # Only produced by whole-buffer tokenization, never reaches the parser
+    OPERATOR                     = 14
+    DIRECTIVE                    = 15
+
+TokenType_Strings = [
+    "MNEMONIC",
+    "LITERAL_8BIT",
+    "LITERAL_16BIT",
+    "HASH",
+    "OPENING_BRACKET",
+    "CLOSING_BRACKET",
+    "COMMA",
+    "EQUALS",
+    "ASSEMBLER_OPTION",
+    "OPT",
+    "COLON",
+    "UNKNOWN",
+    "EOF",
+    "EOL",
+    "OPERATOR",
+    "DIRECTIVE",
+]
+
+# Regex group name -> token type
+TokenType_Codes = {name: code for code, name in enumerate(TokenType_Strings)}
 
 assembler_options = {
     "__NO-UNDOCUMENTED-INSTRUCTION-WARNING": False,
@@ -97,4 +157,29 @@ addressing_modes = {
     Addr_Modes.LABEL:                        [TokenType.MNEMONIC, TokenType.COLON, TokenType.EOF],
     Addr_Modes.JUMP_LABEL:                   [TokenType.MNEMONIC, TokenType.COMMA, TokenType.MNEMONIC, TokenType.EOF]
     # The separator (TokenType.COMMA) is inserted before the file is split and cleaned up.
-}
\ No newline at end of file
+    # Addr_Modes.CONSTANT ("NAME = expression") and Addr_Modes.DIRECTIVE (".name operand, ...") have no fixed pattern, they are recognized before the dispatch index is consulted
+}
+
+# Index register each indexed addressing mode expects after its separator.
+# X and Y indexed modes share a token pattern, so this is what tells them apart.
+index_registers = {
+    Addr_Modes.X_INDEXED_ABSOLUTE:           "X",
+    Addr_Modes.Y_INDEXED_ABSOLUTE:           "Y",
+    Addr_Modes.X_INDEXED_ZERO_PAGE:          "X",
+    Addr_Modes.Y_INDEXED_ZERO_PAGE:          "Y",
+    Addr_Modes.X_INDEXED_ZERO_PAGE_INDIRECT: "X",
+    Addr_Modes.ZERO_PAGE_INDIRECT_Y_INDEXED: "Y",
+}
+
+# Position of the index register token within each indexed addressing mode's pattern
+index_register_positions = {mode: addressing_modes[mode].index(TokenType.COMMA) + 1 for mode in index_registers}
+
+def build_addressing_mode_index() -> dict:
+    index = {}
+    for mode, pattern in addressing_modes.items():
+        index.setdefault(tuple(pattern), []).append(mode)
+    return {pattern: tuple(modes) for pattern, modes in index.items()}
+
+# Dispatch index, built once at import: token type sequence -> candidate addressing modes.
+# Most sequences map to a single mode; the indexed ones map to their X and Y variants.
+addressing_mode_index = build_addressing_mode_index()
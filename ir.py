@@ -0,0 +1,153 @@
+from array import array
+from bisect import bisect_left
+
+from include import diagnostics
+
+# How an instruction's operand is encoded
+ENCODE_NONE     = 0     # No operand
+ENCODE_BYTE     = 1     # 8 bit operand
+ENCODE_WORD     = 2     # 16 bit little endian operand
+ENCODE_RELATIVE = 3     # 8 bit signed offset from the end of the instruction, used by branches
+ENCODE_LONG_BRANCH = 4  # Branch whose target is out of range: the inverted branch skips over a JMP to the target
+ENCODE_ORIGIN   = 5     # Not an instruction: .org or .pad, everything after it continues at the address in its operand
+
+# Size in bytes of an instruction (opcode included) for each operand encoding
+ENCODING_SIZES = (1, 2, 3, 2, 5, 0)
+
+# Fill byte of an origin that leaves its gap empty (.org rather than .pad)
+NO_FILL = -1
+
+# Whether a value can be written with an operand encoding. A long branch's JMP takes a 16 bit address like any other.
+# Branch offsets are checked separately, as they depend on the instruction's address
+def operand_fits(encoding: int, value: int) -> bool:
+    if (encoding == ENCODE_BYTE):
+        return 0 <= value <= 0xFF
+    if (encoding in (ENCODE_WORD, ENCODE_LONG_BRANCH)):
+        return 0 <= value <= 0xFFFF
+    return True
+
+# Operand encoding for each argument size from tables.arg_types
+ARG_TYPE_ENCODINGS = {0: ENCODE_NONE, 8: ENCODE_BYTE, 16: ENCODE_WORD}
+
+# Symbol slot of an instruction whose operand is a plain value
+NO_SYMBOL = -1
+
+# Intermediate representation built by pass 1: every instruction already has its opcode, operand encoding and address.
+# Stored as parallel arrays indexed by instruction, so a whole program costs a couple dozen bytes per instruction.
+# Operands are either a value, or a slot in the symbol table that pass 2 fills in once every label is known.
+# Operands that are an expression using labels also keep the compiled expression (in a dict, as most instructions don't have one), which pass 2 evaluates again.
+# Labels remember which instruction they are in front of, so their addresses can follow when instructions change size.
+# .org and .pad are entries of their own (ENCODE_ORIGIN), whose address is where the code before them ends. A label in front of one belongs to that end,
+# and everything after it starts over at its target address.
+# Constants and .org/.pad operands that use labels keep their compiled expression, as they move along with the labels when addresses are reassigned.
+class Program:
+    def __init__(self):
+        self.linenums: array = array('L')
+        self.addresses: array = array('l')
+        self.opcodes: array = array('B')
+        self.encodings: array = array('B')
+        self.operands: array = array('l')
+        self.symbols: array = array('l')
+        self.label_slots: array = array('l')
+        self.label_indices: array = array('L')
+        self.expressions: dict = {}
+        # Indices of the ENCODE_ORIGIN entries, and the fill byte of those from .pad
+        self.origins: array = array('L')
+        self.fills: dict = {}
+        # Operand expressions of the .org and .pad entries that use labels, by index
+        self.origin_expressions: dict = {}
+        # Constants that use labels (by symbol table slot), which instruction they come before and their expression
+        self.constant_slots: array = array('l')
+        self.constant_indices: array = array('L')
+        self.constant_expressions: list = []
+        # Address just past the last instruction
+        self.end_address: int = 0
+
+    def __len__(self) -> int:
+        return len(self.opcodes)
+
+    # Records that a label (by symbol table slot) points at the next instruction to be appended
+    def add_label(self, slot: int) -> None:
+        self.label_slots.append(slot)
+        self.label_indices.append(len(self.opcodes))
+
+    # Address of the instruction at idx, or of the end of the program if idx is past the last instruction
+    def address_of(self, idx: int) -> int:
+        return self.addresses[idx] if idx < len(self.opcodes) else self.end_address
+
+    # Recomputes the addresses of every instruction from start onwards (and of the labels, constants and origins that depend on them) after something there changed size.
+    # Everything before start keeps its address, so only the part of the program after the change is touched.
+    # Labels and constants are redefined in source order as the addresses get to them, so each only sees values that are already up to date
+    def reassign_addresses(self, start: int, symbols) -> None:
+        address: int = self.addresses[start]
+        label_idx: int = bisect_left(self.label_indices, start)
+        constant_idx: int = bisect_left(self.constant_indices, start)
+        for idx in range(start, len(self.opcodes) + 1):
+            while (label_idx < len(self.label_slots) and self.label_indices[label_idx] == idx):
+                self.redefine(self.label_slots[label_idx], address, symbols)
+                label_idx += 1
+            while (constant_idx < len(self.constant_slots) and self.constant_indices[constant_idx] == idx):
+                self.redefine(self.constant_slots[constant_idx], self.constant_expressions[constant_idx].evaluate(symbols), symbols)
+                constant_idx += 1
+            if (idx == len(self.opcodes)):
+                break
+            self.addresses[idx] = address
+            address += ENCODING_SIZES[self.encodings[idx]]
+            if (self.encodings[idx] == ENCODE_ORIGIN):
+                if (idx in self.origin_expressions):
+                    self.reevaluate_origin(idx, symbols)
+                address = self.operands[idx]
+        self.end_address = address
+
+    # Changes the value of a label or constant. Expressions remember their value until the symbol table changes, so they have to be told
+    def redefine(self, slot: int, value: int, symbols) -> None:
+        if (symbols.addresses[slot] != value):
+            symbols.addresses[slot] = value
+            symbols.generation += 1
+
+    # Evaluates the operands of a .org or .pad that uses labels again, checking them the way pass 1 did
+    def reevaluate_origin(self, idx: int, symbols) -> None:
+        values: list = [operand.evaluate(symbols) for operand in self.origin_expressions[idx]]
+        directive: str = ".PAD" if idx in self.fills else ".ORG"
+        if (not 0 <= values[0] <= 0xFFFF):
+            diagnostics.line_error(self.linenums[idx], f"'{directive}' address {values[0]} is outside of the 6502's address space after branches were made long")
+            return
+        if (idx in self.fills):
+            if (len(values) > 1):
+                if (not 0 <= values[1] <= 0xFF):
+                    diagnostics.line_error(self.linenums[idx], f"'.PAD' fill value {values[1]} doesn't fit in 8 bits after branches were made long")
+                    return
+                self.fills[idx] = values[1]
+            if (values[0] < self.addresses[idx]):
+                diagnostics.line_error(self.linenums[idx], f"'.PAD' address ${values[0]:04X} is behind the current address ${self.addresses[idx]:04X} after branches were made long")
+                return
+        self.operands[idx] = values[0]
+
+    # Records a constant defined in front of the next instruction to be appended. Only those whose expression uses labels are kept, the rest can't change
+    def add_constant(self, slot: int, expression) -> None:
+        if (expression.constant == None):
+            self.constant_slots.append(slot)
+            self.constant_indices.append(len(self.opcodes))
+            self.constant_expressions.append(expression)
+
+    # Everything appended after this continues at target. address is where the code so far ends.
+    # operands are the directive's expressions, kept if any of them uses labels
+    def add_origin(self, linenum: int, address: int, target: int, fill: int, operands: list=[]) -> None:
+        self.origins.append(len(self.opcodes))
+        if (fill != NO_FILL):
+            self.fills[len(self.opcodes)] = fill
+        if (any(operand.constant == None for operand in operands)):
+            self.origin_expressions[len(self.opcodes)] = operands
+        self.append(linenum, address, 0, ENCODE_ORIGIN, target)
+        self.end_address = target
+
+    def append(self, linenum: int, address: int, opcode: int, encoding: int, operand: int, symbol: int=NO_SYMBOL, expression=None) -> None:
+        if (expression != None):
+            self.expressions[len(self.opcodes)] = expression
+        self.linenums.append(linenum)
+        self.addresses.append(address)
+        self.opcodes.append(opcode)
+        self.encodings.append(encoding)
+        self.operands.append(operand)
+        self.symbols.append(symbol)
+        self.end_address = address + ENCODING_SIZES[encoding]
@@ -0,0 +1,159 @@
+import re, unicodedata
+from array import array
+from typing import List, Tuple
+
+from include import Token, TokenType, TokenType_Codes
+
+# Deletes the characters clean_line() drops from pure ASCII lines (ASCII control characters and spaces)
+ASCII_STRIP_TABLE = {code: None for code in [*range(0x20), 0x7F, ord(" ")]}
+
+def clean_line(line: str) -> str:
+    return ''.join(ch for ch in line if unicodedata.category(ch)[0] != "C" and ch != " ").upper()
+
+def tokenize(line: str, r: re) -> List[Token]:
+    tokens: List[Token] = []
+    # Scan the input line using the regexuwu
+    for match in r.finditer(line):
+        tokens.append(Token(TokenType_Codes[match.lastgroup], match.group()))
+    tokens.append(Token(TokenType.EOF, "EOF"))
+    return tokens
+
+# Bytes variants for memory-mapped sources. Only for lines that are pure ASCII, anything else is decoded and goes through the str path
+ASCII_STRIP_BYTES = bytes([*range(0x20), 0x7F, ord(" ")])
+
+def clean_line_bytes(line: bytes) -> bytes:
+    return line.translate(None, ASCII_STRIP_BYTES).upper()
+
+# r must be compiled with regex_init_bytes(). Token values are turned into str (the instruction tables are keyed on them), the line itself is not
+def tokenize_bytes(line: bytes, r: re) -> List[Token]:
+    tokens: List[Token] = []
+    for match in r.finditer(line):
+        tokens.append(Token(TokenType_Codes[match.lastgroup], match.group().decode("ascii")))
+    tokens.append(Token(TokenType.EOF, "EOF"))
+    return tokens
+
+# --------------------------------------------------------------------------------------------------------------
+# Whole-buffer tokenization. Every line goes through a single finditer() pass over one cleaned buffer
+# --------------------------------------------------------------------------------------------------------------
+
+# Same as ASCII_STRIP_TABLE, but keeps the newlines that separate the lines of the buffer
+ASCII_BUFFER_STRIP_TABLE = {code: None for code in [*range(0x20), 0x7F, ord(" ")] if code != ord("\n")}
+
+def clean_buffer(buffer: str) -> str:
+    if (buffer.isascii()):
+        return buffer.translate(ASCII_BUFFER_STRIP_TABLE).upper()
+    return ''.join(ch for ch in buffer if (unicodedata.category(ch)[0] != "C" or ch == "\n") and ch != " ").upper()
+
+# Tokenizes every line at once into two flat, parallel arrays of token types and token values, plus the offset where each line starts in them.
+# Line n is types[line_starts[n]:line_starts[n + 1]], and ends in an EOF token just like tokenize() output.
+# One byte per token type and plain strings keep the whole file's tokens compact; Token objects are only built per line when parsing.
+# r must be compiled with regex_init_buffer()
+def tokenize_buffer(lines: List[str], r: re) -> Tuple[array, List[str], array]:
+    types: array = array('B')
+    values: List[str] = []
+    line_starts: array = array('L', [0])
+    if (len(lines) == 0):
+        return (types, values, line_starts)
+
+    for match in r.finditer(clean_buffer("\n".join(lines))):
+        token_type: int = TokenType_Codes[match.lastgroup]
+        if (token_type == TokenType.EOL):
+            types.append(TokenType.EOF)
+            values.append("EOF")
+            line_starts.append(len(types))
+            continue
+        types.append(token_type)
+        values.append(match.group())
+    types.append(TokenType.EOF)
+    values.append("EOF")
+    line_starts.append(len(types))
+    return (types, values, line_starts)
+
+# --------------------------------------------------------------------------------------------------------------
+# Hand-written scanner. Produces the same tokens as tokenize(clean_line(line), regex) in one walk over the line
+# --------------------------------------------------------------------------------------------------------------
+
+HEX_DIGITS = "0123456789ABCDEF"
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# Single character tokens
+SINGLE_CHARACTER_TOKENS = {
+    "#": TokenType.HASH,
+    "(": TokenType.OPENING_BRACKET,
+    ")": TokenType.CLOSING_BRACKET,
+    ",": TokenType.COMMA,
+    "=": TokenType.EQUALS,
+    ":": TokenType.COLON,
+    "+": TokenType.OPERATOR,
+    "-": TokenType.OPERATOR,
+    "<": TokenType.OPERATOR,
+    ">": TokenType.OPERATOR,
+}
+
+# Same definition of a word character as the regex engine uses for \b
+def is_word_character(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+def scan_line(line: str) -> List[Token]:
+    # Only lines with non-ASCII characters need the unicodedata based cleanup, everything else is stripped in one go
+    if (line.isascii()):
+        line = line.translate(ASCII_STRIP_TABLE).upper()
+    else:
+        line = clean_line(line)
+
+    tokens: List[Token] = []
+    length: int = len(line)
+    idx: int = 0
+    while (idx < length):
+        ch: str = line[idx]
+        start: int = idx
+        idx += 1
+
+        if (ch in LETTERS):
+            # OPT is only its own token when it stands alone as a word
+            if (line.startswith("OPT", start) and (start == 0 or not is_word_character(line[start - 1])) and (start + 3 == length or not is_word_character(line[start + 3]))):
+                idx = start + 3
+                tokens.append(Token(TokenType.OPT, "OPT"))
+                continue
+            while (idx < length and line[idx] in LETTERS):
+                idx += 1
+            tokens.append(Token(TokenType.MNEMONIC, line[start:idx]))
+
+        elif (ch.isdecimal()):
+            # Decimal literals are always matched by the 16 bit pattern first, up to 5 digits long
+            while (idx < length and idx - start < 5 and line[idx].isdecimal()):
+                idx += 1
+            tokens.append(Token(TokenType.LITERAL_16BIT, line[start:idx]))
+
+        elif (ch == "$"):
+            while (idx < length and idx - start < 5 and line[idx] in HEX_DIGITS):
+                idx += 1
+            digits: int = idx - start - 1
+            if (digits == 4):
+                tokens.append(Token(TokenType.LITERAL_16BIT, line[start:idx]))
+            elif (digits >= 2):
+                idx = start + 3
+                tokens.append(Token(TokenType.LITERAL_8BIT, line[start:idx]))
+            else:
+                idx = start + 1
+                tokens.append(Token(TokenType.UNKNOWN, ch))
+
+        elif (ch == "." and idx < length and line[idx] in LETTERS):
+            while (idx < length and line[idx] in LETTERS):
+                idx += 1
+            tokens.append(Token(TokenType.DIRECTIVE, line[start:idx]))
+
+        elif (ch in SINGLE_CHARACTER_TOKENS):
+            tokens.append(Token(SINGLE_CHARACTER_TOKENS[ch], ch))
+
+        elif (ch == "_" and line.startswith("__", start) and start + 2 < length and (line[start + 2] in LETTERS or line[start + 2] == "-")):
+            idx = start + 2
+            while (idx < length and (line[idx] in LETTERS or line[idx] == "-")):
+                idx += 1
+            tokens.append(Token(TokenType.ASSEMBLER_OPTION, line[start:idx]))
+
+        else:
+            tokens.append(Token(TokenType.UNKNOWN, ch))
+
+    tokens.append(Token(TokenType.EOF, "EOF"))
+    return tokens
@@ -0,0 +1,32 @@
+from collections import OrderedDict
+
+# Bounded LRU cache of line text -> (line representation, instruction table index).
+# Unrolled loops and generated tables repeat the same line many times, and a hit skips tokenizing and evaluating it again.
+# Only store things that do not depend on labels: a jump to a label just names the label, which is resolved in pass 2.
+class LineCache:
+    def __init__(self, max_size: int):
+        self.max_size: int = max_size
+        self.entries: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def get(self, key: str):
+        entry = self.entries.get(key)
+        if (entry == None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry) -> None:
+        if (self.max_size <= 0):
+            return
+        self.entries[key] = entry
+        if (len(self.entries) > self.max_size):
+            self.entries.popitem(last=False)
+
+    def __str__(self):
+        lookups: int = self.hits + self.misses
+        hit_rate: float = (100 * self.hits / lookups) if lookups != 0 else 0.0
+        return f"Line cache: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate), {len(self.entries)}/{self.max_size} entries"
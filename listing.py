@@ -0,0 +1,55 @@
+from typing import List, TextIO, Union
+
+from tables import opcode_cycles
+
+# Listing rows are written as pass 2 packs each instruction, and go out in writes this big
+LISTING_BUFFER_SIZE = 0x10000
+
+JMP_ABSOLUTE = 0x4C
+
+# Listing file: every source line, with the address, bytes and cycle count of whatever it assembled to in front of it.
+# Rows are written as pass 2 gets to each instruction, so the listing is never held in memory. Only the source text is,
+# which the preprocessor keeps (in sources, one entry per source line) only when a listing is asked for.
+# Lines that didn't assemble to anything (labels, constants, comments) are written without an address as the instructions after them come along
+class Listing:
+    def __init__(self, filename: str, sources: List[Union[str, bytes]]):
+        self.out_file: TextIO = open(filename, 'w', buffering=LISTING_BUFFER_SIZE)
+        self.sources: List[Union[str, bytes]] = sources
+        # First source line that hasn't been written yet
+        self.next_line: int = 1
+        self.out_file.write(f"{'Line':>6}  {'Addr':<5}  {'Bytes':<14}  {'Cyc':<3}  Source\n")
+
+    def source_text(self, linenum: int) -> str:
+        text = self.sources[linenum - 1]
+        return text.decode("utf-8", errors="replace") if isinstance(text, bytes) else text
+
+    # Writes the source lines before linenum that haven't been written yet
+    def skip_to(self, linenum: int) -> None:
+        while (self.next_line < linenum):
+            self.out_file.write(f"{self.next_line:>6}  {'':<5}  {'':<14}  {'':<3}  {self.source_text(self.next_line)}\n")
+            self.next_line += 1
+
+    # One row of output. A line that assembled to several things only shows its source text on the first of them
+    def row(self, linenum: int, address: int, data: bytes, cycles: str) -> None:
+        self.skip_to(linenum)
+        if (linenum == self.next_line):
+            self.out_file.write(f"{linenum:>6}  ${address:04X}  {data.hex(' ').upper():<14}  {cycles:<3}  {self.source_text(linenum)}\n")
+            self.next_line += 1
+        else:
+            self.out_file.write(f"{'':>6}  ${address:04X}  {data.hex(' ').upper():<14}  {cycles:<3}\n")
+
+    def instruction(self, linenum: int, address: int, data: bytes, opcode: int, long_branch: bool) -> None:
+        cycles: str = opcode_cycles.get(opcode, "")
+        # A long branch is the inverted branch, then the JMP when that isn't taken
+        if (long_branch):
+            cycles = f"{int(opcode_cycles[opcode ^ 0x20].rstrip('+')) + int(opcode_cycles[JMP_ABSOLUTE])}+"
+        self.row(linenum, address, bytes(data), cycles)
+
+    # .org and .pad: the address everything after them continues at
+    def origin(self, linenum: int, address: int) -> None:
+        self.row(linenum, address, b"", "")
+
+    # Writes the source lines after the last instruction and closes the file
+    def finish(self) -> None:
+        self.skip_to(len(self.sources) + 1)
+        self.out_file.close()
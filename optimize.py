@@ -0,0 +1,31 @@
+from include import Addr_Modes
+from tables import opcode_table, size_in_bytes, base_cycles
+
+# Absolute addressing modes, and the zero page mode that does the same with a 1 byte address
+zero_page_equivalents = {
+    Addr_Modes.ABSOLUTE:           Addr_Modes.ZERO_PAGE,
+    Addr_Modes.X_INDEXED_ABSOLUTE: Addr_Modes.X_INDEXED_ZERO_PAGE,
+    Addr_Modes.Y_INDEXED_ABSOLUTE: Addr_Modes.Y_INDEXED_ZERO_PAGE,
+}
+
+# Opcode table entry of the zero page form of an instruction, if its operand fits in zero page and the instruction has that form. None otherwise
+def zero_page_entry(mnemonic: str, mode: Addr_Modes, value: int) -> tuple:
+    zero_page_mode: Addr_Modes = zero_page_equivalents.get(mode)
+    if (zero_page_mode == None or value < 0 or value > 0xFF):
+        return None
+    return opcode_table.get((mnemonic, zero_page_mode))
+
+# Running totals of what the zero page optimization saved
+class ZeroPageStats:
+    def __init__(self):
+        self.instructions: int = 0
+        self.bytes_saved: int = 0
+        self.cycles_saved: int = 0
+
+    def record(self, mnemonic: str, absolute_mode: Addr_Modes, zero_page_mode: Addr_Modes) -> None:
+        self.instructions += 1
+        self.bytes_saved += size_in_bytes[absolute_mode] - size_in_bytes[zero_page_mode]
+        self.cycles_saved += base_cycles.get((mnemonic, absolute_mode), 0) - base_cycles.get((mnemonic, zero_page_mode), 0)
+
+    def __str__(self):
+        return f"Zero page optimization: {self.instructions} {'instruction' if self.instructions == 1 else 'instructions'} shortened, {self.bytes_saved} bytes and {self.cycles_saved} cycles saved"
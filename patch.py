@@ -0,0 +1,115 @@
+import zlib
+from typing import BinaryIO, Iterator, List, Tuple
+
+from include import error
+from segments import MemoryImage
+
+# Ranges are narrowed down by comparing halves until they are this small, then looked at a byte at a time
+COMPARE_SIZE = 16
+
+# Changed ranges closer together than this are patched as one, the unchanged bytes between them cost less than starting another record
+IPS_MERGE_GAP = 5
+BPS_MERGE_GAP = 2
+
+IPS_MAX_SIZE = 0x1000000
+IPS_MAX_RECORD = 0xFFFF
+# A record at this offset would read as the "EOF" end marker
+IPS_EOF_OFFSET = 0x454F46
+
+# Offsets of the bytes in new[start:end] that differ from old. Equal halves are skipped with a single memoryview comparison,
+# so only the neighbourhood of an actual change is ever looked at byte by byte
+def changed_bytes(new: memoryview, old: memoryview, start: int, end: int) -> Iterator[int]:
+    if (new[start:end] == old[start:end]):
+        return
+    if (end - start <= COMPARE_SIZE):
+        yield from (idx for idx in range(start, end) if new[idx] != old[idx])
+        return
+    middle: int = (start + end) // 2
+    yield from changed_bytes(new, old, start, middle)
+    yield from changed_bytes(new, old, middle, end)
+
+# (start, end) of every range where new differs from old, merging ranges at most merge_gap bytes apart.
+# Everything past the end of old counts as changed
+def changed_ranges(new: memoryview, old: memoryview, merge_gap: int) -> List[Tuple[int, int]]:
+    common: int = min(len(new), len(old))
+    ranges: List[Tuple[int, int]] = []
+    for idx in changed_bytes(new, old, 0, common):
+        if (len(ranges) != 0 and idx - ranges[-1][1] <= merge_gap):
+            ranges[-1] = (ranges[-1][0], idx + 1)
+        else:
+            ranges.append((idx, idx + 1))
+    if (len(new) > common):
+        if (len(ranges) != 0 and common - ranges[-1][1] <= merge_gap):
+            ranges[-1] = (ranges[-1][0], len(new))
+        else:
+            ranges.append((common, len(new)))
+    return ranges
+
+# IPS: "PATCH", then a record (3 byte offset, 2 byte size, the bytes) for every changed range, then "EOF".
+# A new image shorter than the base ROM gets the 3 byte truncation size after "EOF" that most patchers understand
+def write_ips(image: MemoryImage, base_rom: bytes, out_file: BinaryIO) -> None:
+    new: memoryview = memoryview(image.flatten())
+    old: memoryview = memoryview(base_rom)
+    if (len(new) > IPS_MAX_SIZE):
+        error(f"[ERROR]: IPS patches can't go past 16MB, the image is {len(new)} bytes", crash=True)
+    try:
+        out_file.write(b"PATCH")
+        for start, end in changed_ranges(new, old, IPS_MERGE_GAP):
+            offset: int = start - 1 if start == IPS_EOF_OFFSET else start
+            while (offset < end):
+                size: int = min(IPS_MAX_RECORD, end - offset)
+                if (offset + size == IPS_EOF_OFFSET and offset + size != end):
+                    size -= 1
+                out_file.write(offset.to_bytes(3, "big") + size.to_bytes(2, "big"))
+                out_file.write(new[offset:offset + size])
+                offset += size
+        out_file.write(b"EOF")
+        if (len(new) < len(old)):
+            out_file.write(len(new).to_bytes(3, "big"))
+    except Exception as e:
+        error(f"[EXCEPTION]: An exception occurred when trying to write to the output file. Assembling cannot continue. Exception is as follows:\n{e}", crash=True)
+
+# BPS variable length number: 7 bits per byte, lowest first, the last byte has bit 7 set
+def bps_number(value: int) -> bytes:
+    encoded: bytearray = bytearray()
+    while (True):
+        low: int = value & 0x7F
+        value >>= 7
+        if (value == 0):
+            encoded.append(0x80 | low)
+            return bytes(encoded)
+        encoded.append(low)
+        value -= 1
+
+# BPS actions. Each is a number holding the length - 1 and the action, SourceRead copies the base ROM at the current output offset, TargetRead is followed by the bytes
+BPS_SOURCE_READ = 0
+BPS_TARGET_READ = 1
+
+# BPS: "BPS1", the sizes of both images and of the (empty) metadata, the actions, then the CRC32s of the base ROM, the new image and the patch itself.
+# Unchanged stretches are read from the base ROM, changed ranges are stored
+def write_bps(image: MemoryImage, base_rom: bytes, out_file: BinaryIO) -> None:
+    new: memoryview = memoryview(image.flatten())
+    old: memoryview = memoryview(base_rom)
+    patch: bytearray = bytearray(b"BPS1")
+    patch += bps_number(len(old)) + bps_number(len(new)) + bps_number(0)
+    output_offset: int = 0
+    for start, end in changed_ranges(new, old, BPS_MERGE_GAP):
+        if (start > output_offset):
+            patch += bps_number((start - output_offset - 1) << 2 | BPS_SOURCE_READ)
+        patch += bps_number((end - start - 1) << 2 | BPS_TARGET_READ)
+        patch += new[start:end]
+        output_offset = end
+    if (len(new) > output_offset):
+        patch += bps_number((len(new) - output_offset - 1) << 2 | BPS_SOURCE_READ)
+    patch += zlib.crc32(old).to_bytes(4, "little") + zlib.crc32(new).to_bytes(4, "little")
+    patch += zlib.crc32(patch).to_bytes(4, "little")
+    try:
+        out_file.write(patch)
+    except Exception as e:
+        error(f"[EXCEPTION]: An exception occurred when trying to write to the output file. Assembling cannot continue. Exception is as follows:\n{e}", crash=True)
+
+# Patch format name -> writer. These take the base ROM as well as the image
+patch_writers = {
+    "ips": write_ips,
+    "bps": write_bps,
+}
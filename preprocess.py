@@ -0,0 +1,75 @@
+import re, mmap
+from typing import Iterator, List, Tuple, TextIO, Union
+
+# The same rewrites are done on str lines, or on bytes lines when the source is memory-mapped
+class PreprocessPatterns:
+    def __init__(self, literal):
+        # Some lines with a label are started like this: "label: instruction" or "label: .directive". This should change that to "label:\ninstruction"
+        self.label_split = re.compile(literal(r'(\w+:)(\s*[A-Za-z.])'))
+        self.label_split_replacement = literal(r'\1\n\2')
+        # Any instruction or directive can be passed a label or an expression starting with one (jumps and branches most of all). This inserts a separator after the mnemonic
+        # to stop the two appearing as one large mnemonic once whitespace is removed. A lone "A" is the accumulator, not a label
+        self.operand_separator = re.compile(literal(r'^(\s*(?:[A-Za-z]{3}|\.[A-Za-z]+))\s+(?![Aa]\s*$)([A-Za-z_])'))
+        self.operand_separator_replacement = literal(r'\1, \2')
+        self.comment_start = re.compile(literal(r'//|/\*'))
+        self.line_comment = literal("//")
+        self.block_comment_end = literal("*/")
+        self.newline = literal("\n")
+        self.line_end = literal("\r\n")
+        self.empty = literal("")
+
+STR_PATTERNS = PreprocessPatterns(str)
+BYTES_PATTERNS = PreprocessPatterns(lambda text: text.encode("ascii"))
+
+# Removes C-style comments from one line. in_block says whether the line starts inside a /* */ comment,
+# and the returned flag whether the next line does
+def strip_comments(line: Union[str, bytes], in_block: bool, patterns: PreprocessPatterns=STR_PATTERNS) -> Tuple[Union[str, bytes], bool]:
+    kept = patterns.empty
+    idx: int = 0
+    while (True):
+        if (in_block):
+            end: int = line.find(patterns.block_comment_end, idx)
+            if (end == -1):
+                return (kept, True)
+            idx = end + 2
+            in_block = False
+
+        match = patterns.comment_start.search(line, idx)
+        if (match == None):
+            return (kept + line[idx:], False)
+        kept += line[idx:match.start()]
+        if (match.group() == patterns.line_comment):
+            return (kept, False)
+        in_block = True
+        idx = match.end()
+
+# Streams the source one line at a time, stripping comments, splitting "label: instruction" lines and inserting the operand separator
+# in a single pass. Yields (source line number, line) for every line that isn't empty, so memory use doesn't depend on the size of the input.
+# If sources is given, every source line is also appended to it as it was read (for --listing, which is the one thing that needs them)
+def preprocess(in_file: TextIO, sources: List[str]=None) -> Iterator[Tuple[int, str]]:
+    return preprocess_lines(in_file, STR_PATTERNS, sources)
+
+# Same as preprocess(), but over the raw bytes of a memory-mapped source. Lines are yielded as bytes and never decoded here
+def preprocess_bytes(buffer: mmap.mmap, sources: List[bytes]=None) -> Iterator[Tuple[int, bytes]]:
+    return preprocess_lines(iter(buffer.readline, b""), BYTES_PATTERNS, sources)
+
+def preprocess_lines(physical_lines: Iterator, patterns: PreprocessPatterns, sources: list=None) -> Iterator[Tuple[int, Union[str, bytes]]]:
+    # Text in front of a block comment spanning several lines is joined to whatever follows the end of the comment,
+    # and goes by the line number where the comment ends
+    pending = patterns.empty
+    in_block: bool = False
+
+    for linenum, physical_line in enumerate(physical_lines, 1):
+        if (sources != None):
+            sources.append(physical_line.rstrip(patterns.line_end))
+        for raw_line in physical_line.splitlines():
+            text, in_block = strip_comments(raw_line, in_block, patterns)
+            if (in_block):
+                pending += text
+                continue
+            text = pending + text
+            pending = patterns.empty
+
+            for line in patterns.label_split.sub(patterns.label_split_replacement, text).split(patterns.newline):
+                if (line.strip()):
+                    yield (linenum, patterns.operand_separator.sub(patterns.operand_separator_replacement, line))
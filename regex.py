@@ -1,5 +1,5 @@
 import re
-from include import TokenType
+from include import TokenType, TokenType_Strings
 
 token_patterns = [
         (TokenType.OPT, r"\bOPT\b"),                                                            # Used for defining assembler options in the file
@@ -13,8 +13,18 @@ token_patterns = [
         (TokenType.EQUALS, r"[=]"),                                                             # Used for defining assembler options in the file
         (TokenType.COLON, r"[:]"),                                                              # Used for labels
         (TokenType.ASSEMBLER_OPTION, r"__[A-Za-z-]+"),                                          # Used for defining assembler options in the file
+        (TokenType.DIRECTIVE, r"\.[A-Za-z]+"),                                                  # Directives like .org
+        (TokenType.OPERATOR, r"[-+<>]"),                                                        # Operators in operand expressions and constant definitions
         (TokenType.UNKNOWN, r'.'),                                                              # Any unknown single character
 ]
 
 def regex_init() -> re:
-    return re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in token_patterns))
\ No newline at end of file
+    return re.compile('|'.join(f'(?P<{TokenType_Strings[token_type]}>{pattern})' for token_type, pattern in token_patterns))
+
+# Whole-buffer variant: same token patterns, plus an end-of-line marker so a single finditer() pass can tokenize every line at once
+def regex_init_buffer() -> re:
+    return re.compile('|'.join(f'(?P<{TokenType_Strings[token_type]}>{pattern})' for token_type, pattern in [(TokenType.EOL, r"\n"), *token_patterns]))
+
+# Bytes variant of regex_init(), for sources that are memory-mapped instead of decoded
+def regex_init_bytes() -> re:
+    return re.compile('|'.join(f'(?P<{TokenType_Strings[token_type]}>{pattern})' for token_type, pattern in token_patterns).encode("ascii"))
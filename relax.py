@@ -0,0 +1,47 @@
+from typing import List
+
+from ir import Program, ENCODE_RELATIVE, ENCODE_LONG_BRANCH, NO_SYMBOL
+from symbols import SymbolTable
+
+# Branch offsets are a signed byte, counted from the end of the 2 byte branch instruction
+def branch_offset_in_range(offset: int) -> bool:
+    return -128 <= offset <= 127
+
+# Branch relaxation, run between pass 1 and pass 2.
+# Every branch starts out short. Any whose target is out of range is rewritten into the long form (the inverted branch skipping over a JMP to the target),
+# which moves everything after it and can push other branches out of range, so this repeats until nothing changes.
+# Branches only ever grow, so that always happens. Returns how many branches were made long
+def relax_branches(program: Program, symbols: SymbolTable) -> int:
+    expanded: int = 0
+    short_branches: List[int] = [idx for idx in range(len(program)) if program.encodings[idx] == ENCODE_RELATIVE]
+
+    while (True):
+        first_changed: int = None
+        still_short: List[int] = []
+        for idx in short_branches:
+            symbol: int = program.symbols[idx]
+            if (idx in program.expressions):
+                target: int = program.expressions[idx].evaluate(symbols)
+            elif (symbol == NO_SYMBOL):
+                target: int = program.operands[idx]
+            elif (symbols.is_defined(symbol)):
+                target: int = symbols.addresses[symbol]
+            else:
+                target: int = None
+            if (target == None):
+                # Unknown labels are reported by pass 2
+                continue
+
+            if (branch_offset_in_range(target - (program.addresses[idx] + 2))):
+                still_short.append(idx)
+                continue
+            program.encodings[idx] = ENCODE_LONG_BRANCH
+            expanded += 1
+            if (first_changed == None):
+                first_changed = idx
+
+        if (first_changed == None):
+            return expanded
+        # Only what comes after the first branch that grew has moved
+        program.reassign_addresses(first_changed, symbols)
+        short_branches = still_short
@@ -0,0 +1,121 @@
+import mmap
+from array import array
+from typing import BinaryIO, Iterator, List, Tuple
+
+from include import diagnostics
+
+# Fills are handed out in blocks of at most this many bytes, so padding a large range never builds the whole range at once
+FILL_BLOCK_SIZE = 0x4000
+
+# The assembled output as a set of address ranges. Only the ranges that hold something take memory:
+# segments hold the bytes of a run of instructions, fills (from .pad) hold a single repeated byte and a length.
+# Ranges are kept in the order they were added, and sorted by address when they are read, so .org can go back and forth freely.
+# Line numbers are the line of the directive that started a range (0 for the segment at the start of the file)
+class MemoryImage:
+    def __init__(self):
+        self.starts: array = array('l')
+        self.datas: List[bytearray] = []      # None for fills
+        self.fill_sizes: array = array('L')
+        self.fill_bytes: array = array('B')
+        self.linenums: array = array('L')
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def add_segment(self, start: int, size: int, linenum: int) -> int:
+        self.starts.append(start)
+        self.datas.append(bytearray(size))
+        self.fill_sizes.append(0)
+        self.fill_bytes.append(0)
+        self.linenums.append(linenum)
+        return len(self.starts) - 1
+
+    def add_fill(self, start: int, end: int, byte: int, linenum: int) -> int:
+        self.starts.append(start)
+        self.datas.append(None)
+        self.fill_sizes.append(end - start)
+        self.fill_bytes.append(byte)
+        self.linenums.append(linenum)
+        return len(self.starts) - 1
+
+    def size_of(self, idx: int) -> int:
+        return self.fill_sizes[idx] if self.datas[idx] == None else len(self.datas[idx])
+
+    def end_of(self, idx: int) -> int:
+        return self.starts[idx] + self.size_of(idx)
+
+    # Indices of the ranges that aren't empty, lowest address first
+    def ordered(self) -> List[int]:
+        return sorted((idx for idx in range(len(self.starts)) if self.size_of(idx) != 0), key=lambda idx: self.starts[idx])
+
+    # Lowest and one past the highest address that holds anything. (0, 0) for an empty image
+    def bounds(self) -> Tuple[int, int]:
+        ordered: List[int] = self.ordered()
+        if (len(ordered) == 0):
+            return (0, 0)
+        return (self.starts[ordered[0]], max(self.end_of(idx) for idx in ordered))
+
+    # Reports every range that starts before the one below it ends. Sorted by address, each range only needs checking against the furthest end so far
+    def check_overlaps(self) -> None:
+        furthest: int = None
+        for idx in self.ordered():
+            if (furthest != None and self.starts[idx] < self.end_of(furthest)):
+                linenum: int = max(self.linenums[idx], self.linenums[furthest])
+                diagnostics.line_error(linenum, f"Output at ${self.starts[idx]:04X}-${self.end_of(idx) - 1:04X} overlaps output at ${self.starts[furthest]:04X}-${self.end_of(furthest) - 1:04X}")
+            if (furthest == None or self.end_of(idx) > self.end_of(furthest)):
+                furthest = idx
+
+    # (address, bytes) for everything in the image, lowest address first. Fills come out as blocks of their byte
+    def chunks(self) -> Iterator[Tuple[int, memoryview]]:
+        for idx in self.ordered():
+            if (self.datas[idx] != None):
+                yield (self.starts[idx], memoryview(self.datas[idx]))
+                continue
+            block: memoryview = memoryview(bytes([self.fill_bytes[idx]]) * min(self.fill_sizes[idx], FILL_BLOCK_SIZE))
+            for offset in range(0, self.fill_sizes[idx], FILL_BLOCK_SIZE):
+                yield (self.starts[idx] + offset, block[:self.fill_sizes[idx] - offset])
+
+    # The image as a flat binary from its lowest address, gaps as zeros
+    def flatten(self) -> bytearray:
+        base, end = self.bounds()
+        flat: bytearray = bytearray(end - base)
+        for address, data in self.chunks():
+            flat[address - base:address - base + len(data)] = data
+        return flat
+
+# MemoryImage whose ranges live directly in the output file instead of in memory. The file is grown to its final size
+# (lowest to highest address, like a flat binary) and memory-mapped, and each segment is a view of its part of the mapping,
+# so pass 2 packs every instruction straight into place in the file and fills are written there as they are added.
+# Gaps stay holes in the file. Nothing is left to write afterwards, close() makes sure it all reached the file.
+# out_file has to be open for reading and writing, which mmap() needs
+class MappedMemoryImage(MemoryImage):
+    def __init__(self, out_file: BinaryIO, base: int, end: int):
+        super().__init__()
+        self.base: int = base
+        out_file.truncate(end - base)
+        # mmap() refuses to map an empty file
+        self.map: mmap.mmap = mmap.mmap(out_file.fileno(), end - base) if end > base else None
+        self.view: memoryview = memoryview(self.map) if self.map != None else memoryview(bytearray())
+
+    def add_segment(self, start: int, size: int, linenum: int) -> int:
+        idx: int = super().add_segment(start, 0, linenum)
+        if (size != 0):
+            self.datas[idx] = self.view[start - self.base:start - self.base + size]
+        return idx
+
+    def add_fill(self, start: int, end: int, byte: int, linenum: int) -> int:
+        idx: int = super().add_fill(start, end, byte, linenum)
+        block: bytes = bytes([byte]) * min(end - start, FILL_BLOCK_SIZE)
+        for address in range(start, end, FILL_BLOCK_SIZE):
+            self.view[address - self.base:min(address + FILL_BLOCK_SIZE, end) - self.base] = block[:min(FILL_BLOCK_SIZE, end - address)]
+        return idx
+
+    # Flushes the mapping and unmaps the file. Every view into it has to be let go of first
+    def close(self) -> None:
+        for data in self.datas:
+            if (isinstance(data, memoryview)):
+                data.release()
+        self.view.release()
+        if (self.map != None):
+            self.map.flush()
+            self.map.close()
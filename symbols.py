@@ -0,0 +1,168 @@
+import sys, mmap, struct
+from array import array
+from typing import List
+
+from include import error
+
+# Line number stored for symbols that have been referenced but not defined (yet)
+UNDEFINED = 0
+# Line number stored for symbols that come from an imported symbol index
+EXTERNAL = 0xFFFFFFFF
+
+# Label name -> address, with O(1) lookups.
+# A dict maps each name to a slot number; the addresses and defining line numbers live in flat arrays indexed by slot,
+# so each symbol costs one dict entry plus a few bytes instead of a tuple per label.
+# Slots are also handed out for names that are only referenced so far, which is what lets the IR point at forward references.
+class SymbolTable:
+    def __init__(self):
+        self.slots: dict = {}
+        self.names: List[str] = []
+        self.addresses: array = array('l')
+        self.linenums: array = array('L')
+        # Imported symbol indexes, searched for names that aren't defined here
+        self.externals: List[SymbolIndex] = []
+        # Bumped whenever a symbol gets an address or its address changes, so results computed from the table know when they are stale
+        self.generation: int = 0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        slot: int = self.slots.get(name)
+        return slot != None and self.linenums[slot] != UNDEFINED
+
+    # Slot for a name, creating an undefined one if the name hasn't been seen yet
+    def reference(self, name: str) -> int:
+        slot: int = self.slots.get(name)
+        if (slot == None):
+            slot = len(self.names)
+            self.slots[name] = slot
+            self.names.append(name)
+            self.addresses.append(0)
+            self.linenums.append(UNDEFINED)
+            for index in self.externals:
+                address: int = index.lookup(name)
+                if (address != None):
+                    self.addresses[slot] = address
+                    self.linenums[slot] = EXTERNAL
+                    break
+        return slot
+
+    # Returns False (and leaves the first definition alone) if the name is already defined
+    def define(self, name: str, address: int, linenum: int) -> bool:
+        slot: int = self.reference(name)
+        if (self.linenums[slot] != UNDEFINED):
+            return False
+        self.addresses[slot] = address
+        self.linenums[slot] = linenum
+        self.generation += 1
+        return True
+
+    def is_defined(self, slot: int) -> bool:
+        return self.linenums[slot] != UNDEFINED
+
+    def is_external(self, name: str) -> bool:
+        slot: int = self.slots.get(name)
+        return slot != None and self.linenums[slot] == EXTERNAL
+
+    # Address of a symbol, or None if it isn't defined
+    def lookup(self, name: str) -> int:
+        slot: int = self.slots.get(name)
+        if (slot == None or self.linenums[slot] == UNDEFINED):
+            return None
+        return self.addresses[slot]
+
+    # Line a symbol was defined on, or None if it isn't defined
+    def definition_line(self, name: str) -> int:
+        slot: int = self.slots.get(name)
+        if (slot == None or self.linenums[slot] == UNDEFINED):
+            return None
+        return self.linenums[slot]
+
+
+# Symbol index file: every symbol defined in one assembly, sorted by name so it can be searched in place without loading it.
+# Layout, all little endian:
+#   header:    magic, format version, symbol count, size of the name blob
+#   offsets:   count + 1 unsigned 32 bit offsets into the name blob, name i runs from offsets[i] to offsets[i + 1]
+#   addresses: count signed 32 bit addresses
+#   names:     every name back to back, in sorted order
+SYMBOL_INDEX_MAGIC = b"UWUS"
+SYMBOL_INDEX_VERSION = 1
+SYMBOL_INDEX_HEADER = struct.Struct("<4sHxxII")
+SYMBOL_INDEX_OFFSET = struct.Struct("<I")
+SYMBOL_INDEX_ADDRESS = struct.Struct("<i")
+
+# Writes the symbols defined by this assembly (imported ones are left out) to a symbol index file
+def export_symbols(symbols: SymbolTable, filename: str) -> None:
+    defined: List[int] = [slot for slot in range(len(symbols)) if symbols.linenums[slot] not in (UNDEFINED, EXTERNAL)]
+    encoded_names: List[bytes] = [symbols.names[slot].encode() for slot in defined]
+    order: List[int] = sorted(range(len(defined)), key=lambda idx: encoded_names[idx])
+
+    offsets: array = array('I', [0])
+    addresses: array = array('i')
+    for idx in order:
+        offsets.append(offsets[-1] + len(encoded_names[idx]))
+        addresses.append(symbols.addresses[defined[idx]])
+    names: bytes = b"".join(encoded_names[idx] for idx in order)
+    if (sys.byteorder == "big"):
+        offsets.byteswap()
+        addresses.byteswap()
+
+    try:
+        with open(filename, 'wb') as index_file:
+            index_file.write(SYMBOL_INDEX_HEADER.pack(SYMBOL_INDEX_MAGIC, SYMBOL_INDEX_VERSION, len(defined), len(names)))
+            index_file.write(offsets.tobytes())
+            index_file.write(addresses.tobytes())
+            index_file.write(names)
+    except Exception as e:
+        error(f"[EXCEPTION]: An exception occurred when trying to write the symbol index '{filename}'. Exception is as follows:\n{e}", crash=True)
+
+# Read-only view of a symbol index file. The file is memory-mapped and names are found with a binary search,
+# so importing a big index costs nothing up front and each lookup only touches a handful of pages
+class SymbolIndex:
+    def __init__(self, filename: str):
+        try:
+            with open(filename, 'rb') as index_file:
+                self.buffer: mmap.mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            error(f"[ERROR]: Couldn't open symbol index '{filename}' - {e}", crash=True)
+
+        if (len(self.buffer) < SYMBOL_INDEX_HEADER.size):
+            error(f"[ERROR]: '{filename}' is not a symbol index", crash=True)
+        magic, version, self.count, names_size = SYMBOL_INDEX_HEADER.unpack_from(self.buffer, 0)
+        if (magic != SYMBOL_INDEX_MAGIC):
+            error(f"[ERROR]: '{filename}' is not a symbol index", crash=True)
+        if (version != SYMBOL_INDEX_VERSION):
+            error(f"[ERROR]: Symbol index '{filename}' has format version {version}, only version {SYMBOL_INDEX_VERSION} is supported", crash=True)
+
+        self.offsets_start: int = SYMBOL_INDEX_HEADER.size
+        self.addresses_start: int = self.offsets_start + (self.count + 1) * SYMBOL_INDEX_OFFSET.size
+        self.names_start: int = self.addresses_start + self.count * SYMBOL_INDEX_ADDRESS.size
+        if (len(self.buffer) != self.names_start + names_size):
+            error(f"[ERROR]: Symbol index '{filename}' is truncated or corrupt", crash=True)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def name(self, idx: int) -> bytes:
+        start: int = SYMBOL_INDEX_OFFSET.unpack_from(self.buffer, self.offsets_start + idx * SYMBOL_INDEX_OFFSET.size)[0]
+        end: int = SYMBOL_INDEX_OFFSET.unpack_from(self.buffer, self.offsets_start + (idx + 1) * SYMBOL_INDEX_OFFSET.size)[0]
+        return self.buffer[self.names_start + start:self.names_start + end]
+
+    def address(self, idx: int) -> int:
+        return SYMBOL_INDEX_ADDRESS.unpack_from(self.buffer, self.addresses_start + idx * SYMBOL_INDEX_ADDRESS.size)[0]
+
+    # Address of a symbol, or None if the index doesn't have it
+    def lookup(self, name: str) -> int:
+        key: bytes = name.encode()
+        low: int = 0
+        high: int = self.count
+        while (low < high):
+            middle: int = (low + high) // 2
+            if (self.name(middle) < key):
+                low = middle + 1
+            else:
+                high = middle
+        if (low < self.count and self.name(low) == key):
+            return self.address(low)
+        return None
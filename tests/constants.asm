@@ -0,0 +1,28 @@
+// Constants (NAME = expression) and expressions using labels. Assemble with --relax-branches:
+// the BNE below can't reach its target otherwise, and becomes F0 03 4C 07 01 (BEQ over a JMP)
+// which moves everything after it, constants worked out from labels included
+
+SCREEN = $0400
+ROW = $28
+ROWTWO = SCREEN + ROW           // $0428
+
+LDX #$00                        // A2 00
+BNE far
+
+message:                        // $0007
+.pad message+$0100, $20         // 256 spaces, up to $0107
+MSGEND = message + $0100        // $0107
+
+far:
+LDA #<message                   // A9 07
+LDY #>MSGEND                    // A0 01
+STA ROWTWO,X                    // 9D 28 04
+LDA table+1                     // AD 16 01 (table is defined further down)
+JMP done                        // 4C 14 01
+
+done:
+RTS                             // 60
+
+table:                          // $0115
+.pad table+2, $FF               // FF FF
+TABLEEND = table + 2            // $0117
@@ -0,0 +1,17 @@
+// .org and .pad, on their own line or after a label
+
+start: .org $C000
+LDX #$00
+copy: LDA table,X
+      STA $0200,X
+      INX
+      CPX #$04
+      BNE copy
+      JMP done
+
+table: .pad table+4, $EA // 4 bytes of $EA
+
+.org $C020
+done:
+.pad $C024
+RTS
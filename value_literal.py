@@ -21,7 +21,7 @@ def evaluate_value_literal(literal: str) -> int:
         base = 2
     elif first_two == "0X" or value[0] == '$' or last_char == 'H':
         base = 16
-    elif last_char == 'D':
+    elif last_char == 'D' or value.isdecimal():
         base = 10
     else:
         return None